@@ -25,6 +25,13 @@ from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 import re
 import json
+import hashlib
+import shutil
+import threading
+import uuid
+import time as tm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
 
 # 1. PAGE CONFIG & THEME
 st.set_page_config(page_title="Ghost Dimension AI", page_icon="👻", layout="wide")
@@ -104,64 +111,739 @@ openai_client, google_client, supabase = init_connections()
 # Load simple variables (no need to cache strings)
 MAKE_WEBHOOK_URL = st.secrets["MAKE_WEBHOOK_URL"]
 
-def get_dbx():
-    """Handles auto-refreshing tokens for 24/7 operation"""
-    return dropbox.Dropbox(
+DBX_POOL_CONNECTIONS = 16
+
+@st.cache_resource
+def get_dbx_manager():
+    """
+    One Dropbox client per process, on a pooled HTTP session (kept-alive TLS).
+    Every HTTP response on the session is counted; the OAuth token endpoint counts as a refresh.
+    """
+    mgr = {"lock": threading.Lock(), "stats_lock": threading.Lock(), "client": None,
+           "stats": {"checkouts": 0, "requests": 0, "refreshes": 0, "since": datetime.now().strftime("%Y-%m-%d %H:%M")}}
+
+    def _count(response, *args, **kwargs):
+        with mgr['stats_lock']:
+            mgr['stats']['requests'] += 1
+            if response.request.url.split("?")[0].endswith("/oauth2/token"): mgr['stats']['refreshes'] += 1
+
+    session = dropbox.create_session(max_connections=DBX_POOL_CONNECTIONS)
+    session.hooks['response'].append(_count)
+    mgr['client'] = dropbox.Dropbox(
         app_key=st.secrets["DROPBOX_APP_KEY"],
         app_secret=st.secrets["DROPBOX_APP_SECRET"],
-        oauth2_refresh_token=st.secrets["DROPBOX_REFRESH_TOKEN"]
+        oauth2_refresh_token=st.secrets["DROPBOX_REFRESH_TOKEN"],
+        session=session
     )
-def upload_to_social_system(local_path, file_name):
-    """Moves file to Dropbox. If file exists, returns the EXISTING link instead of crashing."""
+    return mgr
+
+def get_dbx():
+    """Handles auto-refreshing tokens for 24/7 operation (shared client; the token is only refreshed when it expires)"""
+    mgr = get_dbx_manager()
+    # Refresh here, one thread at a time, so concurrent workers never all hit the token endpoint at once
+    with mgr['lock']:
+        mgr['client'].check_and_refresh_access_token()
+    with mgr['stats_lock']:
+        mgr['stats']['checkouts'] += 1
+    return mgr['client']
+
+def dbx_stats():
+    """Counters since the process started. Before pooling, every checkout was a new client and a token refresh."""
+    mgr = get_dbx_manager()
+    with mgr['stats_lock']: stats = dict(mgr['stats'])
+    stats['refreshes_saved'] = max(0, stats['checkouts'] - stats['refreshes'])
+    return stats
+def upload_to_social_system(local_path, file_name, reuse_link=False):
+    """
+    Moves file to Dropbox. If file exists, returns the EXISTING link instead of crashing.
+    reuse_link: the name is overwritten again later (thumb_<id>.jpg), so its link is cached by path.
+    """
     try:
         dbx = get_dbx()
         db_path = f"/Social System/{file_name}"
         
-        # 1. Upload the file (Overwrite mode ensures we update the image)
-        with open(local_path, "rb") as f:
-            dbx.files_upload(f.read(), db_path, mode=dropbox.files.WriteMode.overwrite)
+        # 1. Upload the file (Overwrite mode ensures we update the image). Big renders stream through a session.
+        if os.path.getsize(local_path) > UPLOAD_SESSION_THRESHOLD:
+            cursor, state_path = upload_session(dbx, local_path, db_path)
+            _chunk_call(lambda: dbx.files_upload_session_finish(b"", cursor, dropbox.files.CommitInfo(path=db_path, mode=dropbox.files.WriteMode.overwrite)))
+            _clear_upload_state(state_path)
+        else:
+            with open(local_path, "rb") as f:
+                dbx.files_upload(f.read(), db_path, mode=dropbox.files.WriteMode.overwrite)
             
-        # 2. Try to get a shared link
-        try:
-            # First, try to create a new one
-            shared_link = dbx.sharing_create_shared_link_with_settings(db_path)
-            url = shared_link.url
-        except dropbox.exceptions.ApiError as e:
-            # If Dropbox says "Link already exists", we ask for the existing one
-            if e.error.is_shared_link_already_exists():
-                links = dbx.sharing_list_shared_links(path=db_path, direct_only=True).links
-                if links:
-                    url = links[0].url
-                else:
-                    st.error("Error: Link exists but cannot be found."); return None
-            else:
-                st.error(f"Dropbox API Error: {e}"); return None
-
-        # 3. Convert to direct stream link (High Quality)
-        return url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "&raw=1")
+        # 2. Shared link -> direct stream link
+        return shared_direct_link(dbx, db_path, reuse_link)
 
     except Exception as e:
         st.error(f"Dropbox Fail: {e}"); return None
 
+def upload_assets_to_social_system(assets):
+    """
+    Several files (e.g. a Short and its Landscape) streamed side by side and committed in one finish_batch.
+    assets: [(local_path, file_name)]. Returns a URL (or None) per asset, in order.
+    """
+    if not assets: return []
+    try:
+        dbx = get_dbx()
+        db_paths = [f"/Social System/{name}" for _, name in assets]
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_PARALLEL, len(assets))) as pool:
+            sessions = list(pool.map(lambda a: upload_session(dbx, a[0], a[1]), zip([p for p, _ in assets], db_paths)))
+        committed = finish_upload_batch(dbx, [(cursor, db_path) for (cursor, _), db_path in zip(sessions, db_paths)])
+        urls = []
+        for (_, state_path), db_path, meta in zip(sessions, db_paths, committed):
+            if meta is None:
+                st.error(f"Dropbox Commit Failed: {db_path}"); urls.append(None); continue
+            _clear_upload_state(state_path)
+            urls.append(shared_direct_link(dbx, db_path))
+        return urls
+    except Exception as e:
+        st.error(f"Dropbox Fail: {e}"); return [None] * len(assets)
+
+def shared_direct_link(dbx, db_path, reuse_link=False):
+    """Shared link for an uploaded file (the existing one if Dropbox already made it), as a direct stream link."""
+    if reuse_link:
+        cached = cached_direct_link(db_path)
+        if cached: return cached
+    try:
+        # First, try to create a new one
+        shared_link = dbx.sharing_create_shared_link_with_settings(db_path)
+        url = shared_link.url
+    except dropbox.exceptions.ApiError as e:
+        # If Dropbox says "Link already exists", we ask for the existing one
+        if e.error.is_shared_link_already_exists():
+            links = dbx.sharing_list_shared_links(path=db_path, direct_only=True).links
+            if links:
+                url = links[0].url
+            else:
+                st.error("Error: Link exists but cannot be found."); return None
+        else:
+            st.error(f"Dropbox API Error: {e}"); return None
+
+    # Convert to direct stream link (High Quality)
+    url = url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "&raw=1")
+    if reuse_link: remember_direct_link(db_path, url)
+    return url
+
+# --- SHARED LINK CACHE (DROPBOX PATH -> DIRECT LINK) ---
+# Overwrites keep their link, so a reused name (thumb_<id>.jpg) never needs the sharing API twice.
+# One-off timestamped uploads skip this entirely - they could never hit.
+LINK_TABLE = "dropbox_links" # path (lower-case, unique), url, updated_at
+
+@st.cache_resource
+def get_link_cache():
+    """Paths looked up (or shared) by this process. LINK_TABLE is only ever queried one path at a time."""
+    return {"lock": threading.Lock(), "links": {}}
+
+def cached_direct_link(db_path):
+    path = db_path.lower()
+    cache = get_link_cache()
+    with cache['lock']:
+        if path in cache['links']: return cache['links'][path]
+    try: rows = supabase.table(LINK_TABLE).select("url").eq("path", path).limit(1).execute().data
+    except Exception: rows = [] # Table unreachable: the sharing API still answers
+    if not rows: return None
+    with cache['lock']: cache['links'][path] = rows[0]['url']
+    return rows[0]['url']
+
+def remember_direct_link(db_path, url):
+    cache = get_link_cache()
+    with cache['lock']: cache['links'][db_path.lower()] = url
+    try: supabase.table(LINK_TABLE).upsert({"path": db_path.lower(), "url": url, "updated_at": datetime.now().isoformat()}, on_conflict="path").execute()
+    except Exception: pass
+
+def forget_direct_link(db_path):
+    """Drops a cached path (called when the library entry it belongs to is deleted)."""
+    cache = get_link_cache()
+    with cache['lock']: cache['links'].pop(db_path.lower(), None)
+    try: supabase.table(LINK_TABLE).delete().eq("path", db_path.lower()).execute()
+    except Exception: pass
+
+# --- SOURCE CACHE (LOCAL COPIES OF DROPBOX VIDEOS) ---
+# Scan, preview, approve and thumbnail all read the same source. Download it once, then hit local disk.
+CACHE_ROOT = st.secrets.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "ghost_cache"))
+SOURCE_CACHE_DIR = os.path.join(CACHE_ROOT, "sources")
+SOURCE_CACHE_MAX_BYTES = int(float(st.secrets.get("SOURCE_CACHE_GB", 8)) * 1024**3)
+SOURCE_REVALIDATE_SECS = 300 # After this a ref is re-checked against the link's ETag / Content-Length
+
+def direct_dropbox_url(url):
+    """Share link -> direct stream link (same rewrite the rest of the app uses)."""
+    if "dropbox.com" in url:
+        url = url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
+    return url
+
+def source_cache_key(video_url):
+    """Stable key per source: host lowercased, dl/raw toggles dropped, remaining params sorted."""
+    parts = urllib.parse.urlsplit(direct_dropbox_url(video_url.strip()))
+    query = sorted((k, v) for k, v in urllib.parse.parse_qsl(parts.query) if k not in ("dl", "raw"))
+    norm = urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), ""))
+    return hashlib.sha256(norm.encode()).hexdigest()[:32]
+
+@st.cache_resource
+def get_source_cache():
+    """Process-wide bookkeeping: one in-flight download per source, everyone else waits for it."""
+    os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+    return {"lock": threading.Lock(), "inflight": {}, "hits": 0, "misses": 0}
+
+def evict_lru(directory, max_bytes, suffixes):
+    """Deletes least-recently-used files (by mtime, which readers touch) until the folder fits max_bytes."""
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffixes): continue
+        path = os.path.join(directory, name)
+        try:
+            info = os.stat(path)
+            entries.append((info.st_mtime, info.st_size, path))
+        except OSError: continue
+    total = sum(e[1] for e in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        try:
+            os.remove(path); total -= size
+        except OSError: pass
+
+def _read_source_ref(ref_path):
+    """{'blob' or 'stream', 'etag', 'length', 'checked'} or None. Old plain-text refs have no validators."""
+    try:
+        with open(ref_path) as f: raw = f.read().strip()
+    except OSError: return None
+    try: ref = json.loads(raw)
+    except ValueError: ref = None
+    return ref if isinstance(ref, dict) else {"blob": raw}
+
+def _write_source_ref(ref_path, ref):
+    ref['checked'] = tm.time()
+    tmp = f"{ref_path}.{uuid.uuid4().hex[:8]}"
+    with open(tmp, "w") as f: json.dump(ref, f)
+    os.replace(tmp, ref_path)
+
+def _remote_validators(response):
+    return {"etag": response.headers.get("ETag"), "length": int(response.headers.get("Content-Length") or 0)}
+
+def _resolve_source_ref(ref_path):
+    """URL ref -> content-addressed blob path (or the remote URL for sources too big to cache), None if gone (evicted)."""
+    ref = _read_source_ref(ref_path)
+    if ref is None: return None
+    if ref.get('stream'): return ref['stream']
+    blob_path = os.path.join(SOURCE_CACHE_DIR, ref.get('blob', ""))
+    if not ref.get('blob') or not os.path.exists(blob_path): return None
+    os.utime(blob_path, None) # LRU touch
+    return blob_path
+
+def _source_ref_current(video_url, ref_path):
+    """
+    False once the file behind the link has changed (different ETag, or Content-Length if there is no ETag).
+    Checked at most every SOURCE_REVALIDATE_SECS; if the check itself fails the cached copy is kept.
+    """
+    ref = _read_source_ref(ref_path)
+    if ref is None: return False
+    if tm.time() - ref.get('checked', 0) < SOURCE_REVALIDATE_SECS: return True
+    try:
+        # Headers only: the body is never read before the connection closes
+        with requests.get(direct_dropbox_url(video_url), stream=True, timeout=(10, 30)) as r:
+            r.raise_for_status()
+            now = _remote_validators(r)
+    except Exception: return True
+    if now['etag'] and ref.get('etag'): same = now['etag'] == ref['etag']
+    else: same = bool(now['length']) and now['length'] == ref.get('length')
+    if same: _write_source_ref(ref_path, {**ref, **now})
+    return same
+
+def _download_source(video_url, ref_path):
+    """Streams the source to disk (bounded memory), names it by content hash and records the URL ref."""
+    remote = direct_dropbox_url(video_url)
+    with requests.get(remote, stream=True, timeout=(10, 60)) as r:
+        r.raise_for_status()
+        validators = _remote_validators(r)
+        # Anything bigger than half the budget would just churn the cache - stream it instead (and remember that)
+        if validators['length'] > SOURCE_CACHE_MAX_BYTES // 2:
+            _write_source_ref(ref_path, {"stream": remote, **validators})
+            return remote
+        ext = os.path.splitext(urllib.parse.urlsplit(remote).path)[1].lower() or ".mp4"
+        part_path = os.path.join(SOURCE_CACHE_DIR, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk); digest.update(chunk)
+            blob = f"{digest.hexdigest()[:32]}{ext}"
+            os.replace(part_path, os.path.join(SOURCE_CACHE_DIR, blob))
+        finally:
+            if os.path.exists(part_path): os.remove(part_path)
+    _write_source_ref(ref_path, {"blob": blob, **validators})
+    evict_lru(SOURCE_CACHE_DIR, SOURCE_CACHE_MAX_BYTES, (".mp4", ".mov", ".m4v", ".mkv", ".avi", ".webm"))
+    return _resolve_source_ref(ref_path) or remote
+
+def local_source(video_url):
+    """
+    Read-through cache for source videos. Returns a local file path (downloading once, deduplicated
+    across threads/sessions) or the direct remote URL if the download is not possible.
+    """
+    if not video_url.startswith("http"): return video_url
+    cache = get_source_cache()
+    key = source_cache_key(video_url)
+    ref_path = os.path.join(SOURCE_CACHE_DIR, f"{key}.ref")
+
+    hit = _resolve_source_ref(ref_path) if _source_ref_current(video_url, ref_path) else None
+    if hit:
+        cache['hits'] += 1
+        return hit
+
+    with cache['lock']:
+        event = cache['inflight'].get(key)
+        owner = event is None
+        if owner:
+            event = threading.Event()
+            cache['inflight'][key] = event
+    if not owner:
+        # Someone else is already downloading this source - wait for their copy
+        event.wait()
+        return _resolve_source_ref(ref_path) or direct_dropbox_url(video_url)
+
+    cache['misses'] += 1
+    try:
+        return _download_source(video_url, ref_path)
+    except Exception:
+        return direct_dropbox_url(video_url)
+    finally:
+        with cache['lock']:
+            cache['inflight'].pop(key, None)
+        event.set()
+
+# --- DROPBOX UPLOAD SESSIONS (CHUNKED, RESUMABLE, BATCH COMMIT) ---
+# Above the threshold a file is never held whole in RAM: it streams in fixed chunks, each retried on its own,
+# with the confirmed offset checkpointed on disk so a re-click after a dropped connection picks up where it stopped.
+UPLOAD_SESSION_THRESHOLD = 32 * 1024**2
+UPLOAD_CHUNK_BYTES = 8 * 1024**2
+UPLOAD_CHUNK_RETRIES = 4
+UPLOAD_PARALLEL = 3
+UPLOAD_SESSION_TTL = 6 * 24 * 3600 # Dropbox keeps open sessions for 7 days
+UPLOAD_STATE_DIR = os.path.join(CACHE_ROOT, "uploads")
+
+def _upload_state_path(local_path, db_path):
+    """Checkpoint file for this exact file version going to this Dropbox path."""
+    stat = os.stat(local_path)
+    key = hashlib.sha1(f"{os.path.abspath(local_path)}|{stat.st_size}|{stat.st_mtime_ns}|{db_path}".encode()).hexdigest()[:20]
+    return os.path.join(UPLOAD_STATE_DIR, f"{key}.json")
+
+def _load_upload_state(path):
+    try:
+        with open(path) as f: state = json.load(f)
+    except (OSError, ValueError): return None
+    return state if tm.time() - state.get('started', 0) < UPLOAD_SESSION_TTL else None
+
+def _save_upload_state(path, state):
+    os.makedirs(UPLOAD_STATE_DIR, exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:6]}"
+    with open(tmp, "w") as f: json.dump(state, f)
+    os.replace(tmp, path)
+
+def _clear_upload_state(path):
+    try: os.remove(path)
+    except OSError: pass
+
+def _prune_upload_states():
+    """Drops checkpoints past the session TTL or whose local file is gone (nothing left to resume)."""
+    if not os.path.isdir(UPLOAD_STATE_DIR): return
+    cutoff = tm.time() - UPLOAD_SESSION_TTL
+    for name in os.listdir(UPLOAD_STATE_DIR):
+        path = os.path.join(UPLOAD_STATE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff: os.remove(path); continue
+            if not name.endswith(".json"): continue
+            with open(path) as f: local = json.load(f).get('local')
+            if local and not os.path.exists(local): os.remove(path)
+        except (OSError, ValueError): continue
+
+def _chunk_call(fn):
+    """One Dropbox request, retried with backoff on network errors, 5xx and rate limits. ApiErrors go straight up."""
+    for attempt in range(UPLOAD_CHUNK_RETRIES + 1):
+        try: return fn()
+        except dropbox.exceptions.RateLimitError as e:
+            if attempt == UPLOAD_CHUNK_RETRIES: raise
+            tm.sleep(e.backoff or 2 ** attempt)
+        except (requests.exceptions.RequestException, dropbox.exceptions.InternalServerError):
+            if attempt == UPLOAD_CHUNK_RETRIES: raise
+            tm.sleep(2 ** attempt)
+
+def upload_session(dbx, local_path, db_path, fresh=False):
+    """
+    Streams a file into a Dropbox upload session and closes it (not yet committed).
+    Returns (cursor, state_path); clear the state once the commit has gone through.
+    """
+    _prune_upload_states()
+    size = os.path.getsize(local_path)
+    state_path = _upload_state_path(local_path, db_path)
+    state = None if fresh else _load_upload_state(state_path)
+    with open(local_path, "rb") as f:
+        if state is None:
+            chunk = f.read(UPLOAD_CHUNK_BYTES)
+            last = len(chunk) >= size
+            res = _chunk_call(lambda: dbx.files_upload_session_start(chunk, close=last))
+            state = {"session_id": res.session_id, "offset": len(chunk), "closed": last, "started": tm.time(), "local": os.path.abspath(local_path)}
+            _save_upload_state(state_path, state)
+        while not state['closed']:
+            f.seek(state['offset'])
+            chunk = f.read(UPLOAD_CHUNK_BYTES)
+            last = state['offset'] + len(chunk) >= size
+            cursor = dropbox.files.UploadSessionCursor(session_id=state['session_id'], offset=state['offset'])
+            try:
+                _chunk_call(lambda: dbx.files_upload_session_append_v2(chunk, cursor, close=last))
+                state['offset'] += len(chunk); state['closed'] = last
+            except dropbox.exceptions.ApiError as e:
+                if e.error.is_incorrect_offset():
+                    # Usually a retried chunk that had in fact landed: trust the server's offset
+                    state['offset'] = e.error.get_incorrect_offset().correct_offset
+                elif e.error.is_closed():
+                    # Only the final append closes a session, so everything is there
+                    state['offset'], state['closed'] = size, True
+                elif e.error.is_not_found() and not fresh:
+                    _clear_upload_state(state_path)
+                    return upload_session(dbx, local_path, db_path, fresh=True)
+                else: raise
+            _save_upload_state(state_path, state)
+    return dropbox.files.UploadSessionCursor(session_id=state['session_id'], offset=state['offset']), state_path
+
+def finish_upload_batch(dbx, finished):
+    """Commits closed sessions [(cursor, db_path)] together. One FileMetadata (or None on failure) per entry."""
+    entries = [dropbox.files.UploadSessionFinishArg(cursor=cursor, commit=dropbox.files.CommitInfo(path=db_path, mode=dropbox.files.WriteMode.overwrite)) for cursor, db_path in finished]
+    if hasattr(dbx, "files_upload_session_finish_batch_v2"):
+        result = _chunk_call(lambda: dbx.files_upload_session_finish_batch_v2(entries))
+    else:
+        # Older SDKs: the batch commit is an async job to poll
+        launch = _chunk_call(lambda: dbx.files_upload_session_finish_batch(entries))
+        if launch.is_complete(): result = launch.get_complete()
+        else:
+            job_id = launch.get_async_job_id()
+            while True:
+                status = _chunk_call(lambda: dbx.files_upload_session_finish_batch_check(job_id))
+                if status.is_complete(): result = status.get_complete(); break
+                tm.sleep(1)
+    return [e.get_success() if e.is_success() else None for e in result.entries]
+
+# --- SOURCE METADATA INDEX (ONE FFPROBE PER SOURCE, KEPT ON DISK) ---
+META_DIR = os.path.join(CACHE_ROOT, "meta")
+
+@st.cache_resource
+def get_meta_memo():
+    """In-process copy of the on-disk index so hot paths don't even re-read the JSON."""
+    return {}
+
+def _meta_key(ref):
+    """Content identity for URLs and cached blobs; path+size+mtime hash for any other local file."""
+    if ref.startswith("http"): return source_identity(direct_dropbox_url(ref))
+    if os.path.dirname(os.path.abspath(ref)) == os.path.abspath(SOURCE_CACHE_DIR): return os.path.basename(ref)
+    return hashlib.sha256(source_identity(ref).encode()).hexdigest()[:32]
+
+def _probe_keyframes(source):
+    """Keyframe timestamps from packet flags (nothing is decoded). Empty list if ffprobe can't tell."""
+    try:
+        out = subprocess.run([
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", source
+        ], check=True, capture_output=True, timeout=300).stdout.decode()
+    except Exception: return []
+    times = []
+    for line in out.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" not in flags: continue
+        try: times.append(float(pts))
+        except ValueError: continue
+    return sorted(times)
+
+def _frame_rate(value):
+    num, _, den = (value or "0/1").partition("/")
+    try: return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError): return 0.0
+
+def probe_metadata(source):
+    """Duration, fps, resolution, rotation, codecs, bitrate and keyframe times. None if there's no video stream."""
+    try:
+        out = subprocess.run([
+            "ffprobe", "-v", "error", "-print_format", "json", "-show_streams", "-show_format", source
+        ], check=True, capture_output=True, timeout=60).stdout
+        probe = json.loads(out)
+    except Exception: return None
+    streams, fmt = probe.get("streams", []), probe.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if not video: return None
+    fps = _frame_rate(video.get("avg_frame_rate")) or _frame_rate(video.get("r_frame_rate"))
+    duration = float(fmt.get("duration") or video.get("duration") or 0)
+    rotation = int(float(video.get("tags", {}).get("rotate", 0) or 0))
+    for side in video.get("side_data_list", []):
+        if "rotation" in side: rotation = int(float(side['rotation']))
+    return {
+        "duration": duration, "fps": fps,
+        "frames": int(video.get("nb_frames") or 0) or int(round(duration * fps)),
+        "width": int(video.get("width", 0)), "height": int(video.get("height", 0)), "rotation": rotation % 360,
+        "vcodec": video.get("codec_name"), "pix_fmt": video.get("pix_fmt"),
+        "vprofile": video.get("profile"), "level": int(video.get("level") or 0),
+        "acodec": audio.get("codec_name") if audio else None,
+        "bitrate": int(fmt.get("bit_rate") or 0),
+        "keyframes": None # Packet scan reads the whole file - filled in by video_keyframes() on first use
+    }
+
+def video_meta(ref):
+    """
+    Metadata for a source (share link, direct URL or local path), probed once and stored under META_DIR.
+    Everything that needs bounds or formats reads this instead of probing the file again.
+    Only streams/format are probed here (fast, safe on the page thread); keyframes come from video_keyframes().
+    """
+    # Key on the resolved copy, so the first call (which downloads) and every later one agree
+    source = local_source(direct_dropbox_url(ref)) if ref.startswith("http") else ref
+    key = _meta_key(source)
+    memo = get_meta_memo()
+    if key in memo: return memo[key]
+    path = os.path.join(META_DIR, f"{key}.json")
+    try:
+        with open(path) as f: meta = json.load(f)
+    except (OSError, ValueError):
+        meta = probe_metadata(source)
+        if meta is None: return None
+        _store_meta(path, meta)
+    memo[key] = meta
+    return meta
+
+def _store_meta(path, meta):
+    os.makedirs(META_DIR, exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    with open(tmp, "w") as f: json.dump(meta, f)
+    os.replace(tmp, path)
+
+def video_keyframes(ref):
+    """
+    Keyframe times for a source, scanned the first time something needs them (smart cut, keyframe sampler)
+    and then kept in its index entry. Call from workers: the packet listing reads the whole file.
+    """
+    meta = video_meta(ref)
+    if meta is None: return []
+    if meta.get('keyframes') is None:
+        source = local_source(direct_dropbox_url(ref)) if ref.startswith("http") else ref
+        meta['keyframes'] = _probe_keyframes(source)
+        _store_meta(os.path.join(META_DIR, f"{_meta_key(source)}.json"), meta)
+    return meta['keyframes']
+
 # --- THUMBNAIL ENGINE (NO OVERFLOW - SAFETY FIRST) ---
-def create_thumbnail(video_url, time_sec, overlay_text):
+THUMB_FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-ExtraBold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+    "impact.ttf", "Impact.ttf", "Arial Black.ttf", "arialbd.ttf", "arial.ttf"
+]
+THUMB_LINE_GAP = 20
+THUMB_SAFE_WIDTH = 0.85 # Keep 15% margin total
+THUMB_MAX_TEXT_HEIGHT = 0.9
+THUMB_LAYOUT_CACHE_SIZE = 512
+
+@st.cache_resource
+def get_font_registry():
+    """Process-wide: the resolved font file, loaded faces per size, and finished text layouts."""
+    # FreeType faces are shared between threads, so glyph drawing is serialized on draw_lock
+    return {"lock": threading.Lock(), "draw_lock": threading.Lock(), "path": None, "resolved": False, "faces": {}, "layouts": OrderedDict()}
+
+def thumb_font(size):
+    """Cached TrueType face for the first font on this box that loads (probed once per process)."""
+    reg = get_font_registry()
+    with reg['lock']:
+        if not reg['resolved']:
+            for f_path in THUMB_FONT_CANDIDATES:
+                if f_path.startswith("/") and not os.path.exists(f_path): continue
+                try:
+                    ImageFont.truetype(f_path, 12)
+                    reg['path'] = f_path; break
+                except OSError: continue
+            reg['resolved'] = True
+        if size not in reg['faces']:
+            reg['faces'][size] = ImageFont.truetype(reg['path'], size) if reg['path'] else ImageFont.load_default()
+        return reg['faces'][size]
+
+def _wrap_measured(font, words, max_w, stroke):
+    """Greedy word wrap on real glyph advances. None if a single word can't fit at this size."""
+    lines, current = [], ""
+    for word in words:
+        trial = f"{current} {word}".strip()
+        if font.getlength(trial) + 2 * stroke <= max_w:
+            current = trial; continue
+        if font.getlength(word) + 2 * stroke > max_w: return None
+        lines.append(current); current = word
+    if current: lines.append(current)
+    return lines
+
+def layout_thumbnail_text(text, width, height, fontsize):
     """
-    Final Engine v3:
-    - Fixes "Text off edge" by assuming letters are WIDE.
-    - Vertical: Font reduced to 13% for safety.
-    - Landscape: Font stays big (20%).
-    - Margins: Increased to keep text centered and safe.
+    Wrapped lines + draw positions for overlay text, cached per (text, frame size, start size).
+    Shrinks the font until the longest word fits the safe width and the block fits the frame.
+    Returns (fontsize, [(line, x, y)], shadow_offset, stroke_width).
     """
-    import textwrap
-    from PIL import ImageEnhance, ImageFilter, ImageDraw, ImageFont, ImageOps, Image
-    import os
+    reg = get_font_registry()
+    key = (text, width, height, fontsize)
+    with reg['lock']:
+        if key in reg['layouts']:
+            reg['layouts'].move_to_end(key)
+            return reg['layouts'][key]
+
+    words = text.upper().split()
+    max_w = width * THUMB_SAFE_WIDTH
+    size = fontsize
+    while True:
+        font = thumb_font(size)
+        stroke = int(size * 0.08)
+        lines = _wrap_measured(font, words, max_w, stroke)
+        if lines:
+            a_box = font.getbbox("A")
+            line_h = a_box[3] - a_box[1]
+            total_h = (line_h * len(lines)) + (THUMB_LINE_GAP * (len(lines) - 1))
+            if total_h <= height * THUMB_MAX_TEXT_HEIGHT or size <= 12: break
+        elif size <= 12:
+            lines = [" ".join(words)]; line_h = font.getbbox("A")[3]; total_h = line_h; break
+        size = max(12, int(size * 0.9))
+
+    start_y = (height - total_h) / 2
+    placed = []
+    for i, line in enumerate(lines):
+        l_w = font.getlength(line)
+        placed.append((line, (width - l_w) / 2, start_y + (i * (line_h + THUMB_LINE_GAP))))
+    result = (size, placed, int(size * 0.1), stroke)
+    with reg['lock']:
+        reg['layouts'][key] = result
+        while len(reg['layouts']) > THUMB_LAYOUT_CACHE_SIZE: reg['layouts'].popitem(last=False)
+    return result
+
+# Same maths as PIL's Sharpness(1.5): img + 0.5 * (img - SMOOTH(img)), folded into one 3x3 kernel
+SHARPEN_AMOUNT = 0.5
+_SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+SHARPEN_KERNEL = -SHARPEN_AMOUNT * _SMOOTH_KERNEL
+SHARPEN_KERNEL[1, 1] += 1 + SHARPEN_AMOUNT
+VIGNETTE_CACHE_SIZE = 4
+
+@st.cache_resource
+def get_vignette_cache():
+    return {"lock": threading.Lock(), "masks": OrderedDict()}
+
+def vignette_mask(width, height):
+    """
+    3-channel uint8 vignette for a frame size, built once and reused.
+    Same ellipse + GaussianBlur as the legacy PIL chain (PIL's blur differs from cv2's in kernel and edge
+    handling), but drawn on a 1/4-size canvas and upscaled: within 3 levels of the full-size mask.
+    """
+    cache = get_vignette_cache()
+    with cache['lock']:
+        mask = cache['masks'].get((width, height))
+        if mask is not None:
+            cache['masks'].move_to_end((width, height))
+            return mask
+    from PIL import ImageFilter
+    sw, sh = max(8, width // 4), max(8, height // 4)
+    small = Image.new('L', (sw, sh), 0)
+    ImageDraw.Draw(small).ellipse((sw*0.1, sh*0.1, sw*0.9, sh*0.9), fill=255)
+    small = np.asarray(small.filter(ImageFilter.GaussianBlur(radius=min(sw, sh)*0.2)))
+    mask = cv2.cvtColor(cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR), cv2.COLOR_GRAY2RGB)
+    with cache['lock']:
+        cache['masks'][(width, height)] = mask
+        while len(cache['masks']) > VIGNETTE_CACHE_SIZE: cache['masks'].popitem(last=False)
+    return mask
+
+def contrast_lut(mean, factor):
+    """PIL's Contrast enhance as a 256-entry table: mean + factor * (value - mean)."""
+    return np.clip(mean + factor * (np.arange(256, dtype=np.float32) - mean) + 0.5, 0, 255).astype(np.uint8)
+
+def enhance_thumbnail_frame(pil_img):
+    """Contrast (lookup table) + sharpen (one 3x3 kernel), and a cached vignette on landscape frames."""
+    arr = np.asarray(pil_img.convert("RGB"))
+    height, width = arr.shape[:2]
+    is_landscape = width > height
+    contrast_val = 1.3 if is_landscape else 1.1
+    mean = int(cv2.mean(cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY))[0] + 0.5)
+    arr = cv2.LUT(arr, contrast_lut(mean, contrast_val))
+    arr = cv2.filter2D(arr, -1, SHARPEN_KERNEL, borderType=cv2.BORDER_REPLICATE)
+
+    # Cinematic Vignette (Landscape Only)
+    if is_landscape:
+        arr = cv2.multiply(arr, vignette_mask(width, height), scale=1 / 255)
+    return Image.fromarray(arr)
+
+def _enhance_thumbnail_frame_legacy(pil_img):
+    """The original PIL chain, kept only so the benchmark can compare against it."""
+    from PIL import ImageEnhance, ImageFilter
+    width, height = pil_img.size
+    is_landscape = width > height
+    contrast_val = 1.3 if is_landscape else 1.1
+    enhancer = ImageEnhance.Contrast(pil_img)
+    pil_img = enhancer.enhance(contrast_val) 
+    enhancer = ImageEnhance.Sharpness(pil_img)
+    pil_img = enhancer.enhance(1.5)
+
+    # Cinematic Vignette (Landscape Only)
+    if is_landscape:
+        vignette = Image.new('L', (width, height), 0)
+        draw_v = ImageDraw.Draw(vignette)
+        draw_v.ellipse((width*0.1, height*0.1, width*0.9, height*0.9), fill=255)
+        vignette = vignette.filter(ImageFilter.GaussianBlur(radius=min(width, height)*0.2))
+        pil_img = Image.composite(Image.new('RGB', (width, height), (0, 0, 0)), pil_img, ImageOps.invert(vignette))
+    return pil_img
+
+def benchmark_thumbnail_enhance(repeats=3):
+    """Legacy vs vectorized enhancement on synthetic 1080p/4K frames. First new run includes building the mask."""
+    rows = []
+    rng = np.random.default_rng(0)
+    for label, (w, h) in [("1080p landscape", (1920, 1080)), ("1080p vertical", (1080, 1920)), ("4K landscape", (3840, 2160)), ("4K vertical", (2160, 3840))]:
+        frame = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+        timings = {}
+        for name, fn in (("legacy", _enhance_thumbnail_frame_legacy), ("vectorized", enhance_thumbnail_frame)):
+            runs = []
+            for _ in range(repeats):
+                started = tm.perf_counter()
+                fn(frame)
+                runs.append(tm.perf_counter() - started)
+            timings[name] = runs
+        rows.append({
+            "frame": label, "legacy_ms": round(np.median(timings['legacy']) * 1000, 1),
+            "vectorized_first_ms": round(timings['vectorized'][0] * 1000, 1),
+            "vectorized_ms": round(np.median(timings['vectorized'][1:] or timings['vectorized']) * 1000, 1),
+            "speedup": f"{np.median(timings['legacy']) / max(np.median(timings['vectorized'][1:] or timings['vectorized']), 1e-6):.1f}x"
+        })
+    return rows
+
+def render_thumbnail(pil_img, overlay_text):
+    """Enhancement + overlay text on an already-decoded frame."""
+    width, height = pil_img.size
+    # 🟢 DETECT ORIENTATION
+    is_landscape = width > height
+
+    # --- 1. IMAGE ENHANCEMENT ---
+    pil_img = enhance_thumbnail_frame(pil_img)
+
+    # --- 2. TEXT RENDERING ---
+    if overlay_text and overlay_text.strip():
+        draw = ImageDraw.Draw(pil_img)
+
+        # 🛑 FONT SIZING
+        # Landscape: 20% (Big)
+        # Vertical: 13% (Safe - prevents overflow)
+        fontsize = int(height * 0.20) if is_landscape else int(width * 0.13)
+        size, placed, shadow_off, stroke_w = layout_thumbnail_text(overlay_text, width, height, fontsize)
+        font = thumb_font(size)
+
+        with get_font_registry()['draw_lock']:
+            for line, pos_x, pos_y in placed:
+                # Shadow
+                draw.text((pos_x + shadow_off, pos_y + shadow_off), line, font=font, fill="black")
+                # Main Text
+                draw.text((pos_x, pos_y), line, font=font, fill="#FFFF00", stroke_width=stroke_w, stroke_fill="black")
+    return pil_img
 
+def create_thumbnail(video_url, time_sec, overlay_text):
+    """
+    Final Engine v4:
+    - Text is wrapped on real glyph widths and shrunk until the longest word fits (no off-edge text).
+    - Vertical: Font starts at 13% of width. Landscape: starts big (20% of height).
+    - Fonts and layouts are cached process-wide, so repeat previews skip all of that work.
+    """
     try:
         # Clean Dropbox Link
-        if "dropbox.com" in video_url:
-            video_url = video_url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
+        video_url = direct_dropbox_url(video_url)
 
-        cap = cv2.VideoCapture(video_url)
+        cap = cv2.VideoCapture(local_source(video_url))
         cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
         ret, frame = cap.read()
         cap.release()
@@ -170,97 +852,61 @@ def create_thumbnail(video_url, time_sec, overlay_text):
 
         # Convert to PIL
         img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img)
-        width, height = pil_img.size
-        
-        # 🟢 DETECT ORIENTATION
-        is_landscape = width > height
-
-        # --- 1. IMAGE ENHANCEMENT ---
-        contrast_val = 1.3 if is_landscape else 1.1
-        enhancer = ImageEnhance.Contrast(pil_img)
-        pil_img = enhancer.enhance(contrast_val) 
-        enhancer = ImageEnhance.Sharpness(pil_img)
-        pil_img = enhancer.enhance(1.5)
-
-        # Cinematic Vignette (Landscape Only)
-        if is_landscape:
-            vignette = Image.new('L', (width, height), 0)
-            draw_v = ImageDraw.Draw(vignette)
-            draw_v.ellipse((width*0.1, height*0.1, width*0.9, height*0.9), fill=255)
-            vignette = vignette.filter(ImageFilter.GaussianBlur(radius=min(width, height)*0.2))
-            pil_img = Image.composite(Image.new('RGB', (width, height), (0, 0, 0)), pil_img, ImageOps.invert(vignette))
-
-        # --- 2. TEXT RENDERING ---
-        if overlay_text:
-            draw = ImageDraw.Draw(pil_img)
-
-            # 🛑 FONT SIZING
-            # Landscape: 20% (Big)
-            # Vertical: 13% (Safe - prevents overflow)
-            if is_landscape:
-                fontsize = int(height * 0.20) 
-            else:
-                fontsize = int(width * 0.13) 
-
-            # 🛑 ROBUST FONT LOADER
-            def load_font(size):
-                font_candidates = [
-                    "/usr/share/fonts/truetype/dejavu/DejaVuSans-ExtraBold.ttf",
-                    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-                    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
-                    "impact.ttf", "Impact.ttf", "Arial Black.ttf", "arialbd.ttf"
-                ]
-                for f_path in font_candidates:
-                    try:
-                        if f_path.startswith("/") and not os.path.exists(f_path): continue
-                        return ImageFont.truetype(f_path, size)
-                    except: continue
-                try: return ImageFont.truetype("arial.ttf", size)
-                except: return ImageFont.load_default()
-
-            font = load_font(fontsize)
-
-            # 🛑 SAFETY WRAP LOGIC
-            # We assume letters are '0.7' width (Very Wide) to force early wrapping.
-            # This makes the text stack vertically instead of running off the side.
-            safe_width_ratio = 0.85 # Keep 15% margin total
-            safe_pixel_width = width * safe_width_ratio
-            
-            avg_char_w = fontsize * 0.7 
-            
-            chars_per_line = int(safe_pixel_width / avg_char_w)
-            if chars_per_line < 4: chars_per_line = 4
-            
-            # break_long_words=False ensures "CRAZY" stays together
-            lines = textwrap.wrap(overlay_text.upper(), width=chars_per_line, break_long_words=False) 
-
-            # Calculate height
-            bbox = draw.textbbox((0, 0), "A", font=font)
-            line_h = bbox[3] - bbox[1]
-            total_h = (line_h * len(lines)) + (20 * (len(lines)-1))
-            start_y = (height - total_h) / 2
-
-            # Draw
-            for i, line in enumerate(lines):
-                l_bbox = draw.textbbox((0,0), line, font=font)
-                l_w = l_bbox[2] - l_bbox[0]
-                pos_x = (width - l_w) / 2
-                pos_y = start_y + (i * (line_h + 20))
-
-                # Shadow
-                shadow_off = int(fontsize * 0.1)
-                draw.text((pos_x + shadow_off, pos_y + shadow_off), line, font=font, fill="black")
-
-                # Main Text
-                stroke_w = int(fontsize * 0.08)
-                draw.text((pos_x, pos_y), line, font=font, fill="#FFFF00", stroke_width=stroke_w, stroke_fill="black")
+        return render_thumbnail(Image.fromarray(img), overlay_text)
 
     except Exception as e:
         st.error(f"Thumbnail Error: {e}")
         return None
-    
-    return pil_img
+
+# --- THUMBNAIL VARIANTS (ONE DECODE, PARALLEL RENDER) ---
+THUMB_LAYOUTS = {"🖥️ Landscape": 16 / 9, "📱 Vertical": 9 / 16}
+THUMB_VARIANT_WORKERS = 4
+THUMB_VARIANT_LIMIT = 24
+THUMB_VARIANT_PREVIEW = 480 # Long side of the JPEG kept per variant; "Use" re-renders the pick at full size
+
+def crop_to_aspect(pil_img, aspect):
+    """Centre crop to width/height = aspect (always a new image, so shared frames stay untouched)."""
+    width, height = pil_img.size
+    if width / height > aspect:
+        new_w = int(height * aspect)
+        left = (width - new_w) // 2
+        return pil_img.crop((left, 0, left + new_w, height))
+    new_h = int(width / aspect)
+    top = (height - new_h) // 2
+    return pil_img.crop((0, top, width, top + new_h))
+
+def thumbnail_variants(video_url, timestamps, texts, layouts):
+    """
+    Every timestamp x text x layout as a finished thumbnail.
+    Frames come from one forward pass over a single capture (iter_frames_at_times: short gaps are
+    grabbed through, long ones seek); the renders share them across a thread pool.
+    Returns ([{'ts', 'text', 'layout', 'preview' (small JPEG bytes)}] in timestamp/text/layout order,
+    combinations dropped over THUMB_VARIANT_LIMIT). Full-size images are never kept - see render_thumbnail_variant().
+    """
+    frames, times = frames_at_times(local_source(direct_dropbox_url(video_url)), timestamps)
+    texts = texts or [""]
+    combos = [(frame, t, text, layout) for frame, t in zip(frames, times) for text in texts for layout in layouts]
+    dropped = max(0, len(combos) - THUMB_VARIANT_LIMIT)
+    combos = combos[:THUMB_VARIANT_LIMIT]
+    if not combos: return [], 0
+
+    def _render(combo):
+        frame, t, text, layout = combo
+        preview = render_thumbnail(crop_to_aspect(frame, THUMB_LAYOUTS[layout]), text)
+        preview.thumbnail((THUMB_VARIANT_PREVIEW, THUMB_VARIANT_PREVIEW))
+        buf = io.BytesIO()
+        preview.convert("RGB").save(buf, format="JPEG", quality=85)
+        return {"ts": t, "text": text, "layout": layout, "preview": buf.getvalue()}
+
+    with ThreadPoolExecutor(max_workers=min(THUMB_VARIANT_WORKERS, len(combos))) as pool:
+        return list(pool.map(_render, combos)), dropped
+
+def render_thumbnail_variant(video_url, ts, text, layout):
+    """The full-size thumbnail for one picked variant (one frame decode). None if the frame can't be read."""
+    frames, _ = frames_at_times(local_source(direct_dropbox_url(video_url)), [ts])
+    if not frames: return None
+    return render_thumbnail(crop_to_aspect(frames[0], THUMB_LAYOUTS[layout]), text)
+
 # --- GLOBAL OPTIONS ---
 STRATEGY_OPTIONS = ["🎲 AI Choice (Promotional)", "🔥 Viral / Debate (Ask Questions)", "🕵️ Investigator (Analyze Detail)", "📖 Storyteller (Creepypasta)", "😱 Pure Panic (Short & Scary)"]
 
@@ -731,111 +1377,1394 @@ def get_caption_prompt(style, topic, context):
     return f"Role: Ghost Dimension Official Social Media Lead. Brand Context: {context}. Topic: {topic}. Strategy: {strategies.get(style, strategies['🔥 Viral / Debate (Ask Questions)'])}. IMPORTANT: Output ONLY the final caption text. Do not include 'Post Copy:' or markdown headers."
 
 # --- VIDEO PROCESSING ENGINE (DUAL FORMAT SUPPORT) ---
-def process_reel(video_url, start_time_sec, duration, effect, output_filename, crop=True):
-    """Renders video. If crop=False, it fits video into 1920x1080 with black bars (No Crop)."""
-    if "dropbox.com" in video_url:
-        video_url = video_url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
+# EFFECT LIBRARY
+REEL_FX_MAP = {
+    "None": "",
+    "🟢 CCTV (Green)": ",curves=all='0/0 0.5/0.5 1/1':g='0/0 0.5/0.8 1/1',noise=alls=20:allf=t+u",
+    "🔵 Ectoplasm (Blue NV)": ",curves=all='0/0 0.5/0.5 1/1':b='0/0 0.5/0.8 1/1',noise=alls=10:allf=t+u",
+    "🔴 Demon Mode": ",colorbalance=rs=0.5:gs=-0.5:bs=-0.5,vignette",
+    "⚫ Noir (B&W)": ",hue=s=0,curves=strong_contrast,noise=alls=10:allf=t+u",
+    "🏚️ Old VHS": ",curves=vintage,noise=alls=15:allf=t+u,vignette",
+    "⚡ Poltergeist (Static)": ",noise=alls=40:allf=t+u",
+    "📜 Sepia (1920s)": ",colorchannelmixer=.393:.769:.189:0:.349:.686:.168:0:.272:.534:.131",
+    "📸 Negative (Invert)": ",negate",
+    "🪞 Mirror World": ",hflip",
+    "🖍️ Edge Detect": ",edgedetect=low=0.1:high=0.4",
+    "🔥 Deep Fried": ",eq=contrast=2:saturation=2",
+    "👻 Ghostly Blur": ",boxblur=10:1",
+    "🔦 Spotlight": ",vignette=PI/4",
+    "🔮 Purple Haze": ",colorbalance=rs=0.2:gs=-0.2:bs=0.4",
+    "🧊 Frozen": ",colorbalance=rs=-0.2:gs=0.2:bs=0.6",
+    "🩸 Blood Bath": ",colorbalance=rs=0.8:gs=-0.5:bs=-0.5",
+    "🌚 Midnight": ",eq=brightness=-0.2:contrast=1.2",
+    "📻 Radio Tower": ",hue=s=0,noise=alls=30:allf=t+u",
+    "👽 Alien": ",colorbalance=rs=-0.1:gs=0.4:bs=0.1,noise=alls=10:allf=t+u"
+}
 
-    # FILTER LOGIC
+def reel_base_filter(crop=True, proxy=False):
+    """Geometry part of the filter chain for the Short (crop) or the Landscape (pad) output."""
     if crop:
         # Vertical 9:16 (Zoom to fill)
-        base = "crop=ih*(9/16):ih:iw/2-ow/2:0,scale=1080:1920"
-    else:
-        # Landscape 16:9 (Fit inside 1920x1080 with black bars - safer than raw scaling)
-        base = "scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2"
-    
-    # EFFECT LIBRARY
-    fx_map = {
-        "None": "",
-        "🟢 CCTV (Green)": ",curves=all='0/0 0.5/0.5 1/1':g='0/0 0.5/0.8 1/1',noise=alls=20:allf=t+u",
-        "🔵 Ectoplasm (Blue NV)": ",curves=all='0/0 0.5/0.5 1/1':b='0/0 0.5/0.8 1/1',noise=alls=10:allf=t+u",
-        "🔴 Demon Mode": ",colorbalance=rs=0.5:gs=-0.5:bs=-0.5,vignette",
-        "⚫ Noir (B&W)": ",hue=s=0,curves=strong_contrast,noise=alls=10:allf=t+u",
-        "🏚️ Old VHS": ",curves=vintage,noise=alls=15:allf=t+u,vignette",
-        "⚡ Poltergeist (Static)": ",noise=alls=40:allf=t+u",
-        "📜 Sepia (1920s)": ",colorchannelmixer=.393:.769:.189:0:.349:.686:.168:0:.272:.534:.131",
-        "📸 Negative (Invert)": ",negate",
-        "🪞 Mirror World": ",hflip",
-        "🖍️ Edge Detect": ",edgedetect=low=0.1:high=0.4",
-        "🔥 Deep Fried": ",eq=contrast=2:saturation=2",
-        "👻 Ghostly Blur": ",boxblur=10:1",
-        "🔦 Spotlight": ",vignette=PI/4",
-        "🔮 Purple Haze": ",colorbalance=rs=0.2:gs=-0.2:bs=0.4",
-        "🧊 Frozen": ",colorbalance=rs=-0.2:gs=0.2:bs=0.6",
-        "🩸 Blood Bath": ",colorbalance=rs=0.8:gs=-0.5:bs=-0.5",
-        "🌚 Midnight": ",eq=brightness=-0.2:contrast=1.2",
-        "📻 Radio Tower": ",hue=s=0,noise=alls=30:allf=t+u",
-        "👽 Alien": ",colorbalance=rs=-0.1:gs=0.4:bs=0.1,noise=alls=10:allf=t+u"
+        w, h = (360, 640) if proxy else (1080, 1920)
+        return f"crop=ih*(9/16):ih:iw/2-ow/2:0,scale={w}:{h}"
+    # Landscape 16:9 (Fit inside 1920x1080 with black bars - safer than raw scaling)
+    w, h = (640, 360) if proxy else (1920, 1080)
+    return f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2"
+
+# ENCODER PROFILES
+# Quality is set by "crf" (constant quality) or "bitrate" (target average); "maxrate" caps CRF peaks for the platforms.
+# gop is in frames (~2s at 30fps keeps seeking snappy); threads 0 = let x264 decide.
+ENCODER_PROFILES = {
+    # Proxy previews are only watched in a 1/3-width column, so small + fast beats pretty
+    "preview": {"preset": "ultrafast", "tune": "fastdecode", "crf": 32, "gop": 60, "audio": "64k", "threads": 2},
+    "short-final": {"preset": "veryfast", "crf": 23, "maxrate": "8M", "bufsize": "16M", "gop": 60, "audio": "128k", "threads": 0},
+    "landscape-final": {"preset": "veryfast", "crf": 22, "maxrate": "12M", "bufsize": "24M", "gop": 60, "audio": "160k", "threads": 0},
+    "archive": {"preset": "slow", "crf": 18, "gop": 250, "audio": "192k", "threads": 0}
+}
+
+def encode_args(profile):
+    """ffmpeg output options for a named ENCODER_PROFILES entry."""
+    p = ENCODER_PROFILES[profile]
+    args = ["-c:v", "libx264", "-preset", p['preset']]
+    if p.get("tune"): args += ["-tune", p['tune']]
+    if p.get("bitrate"): args += ["-b:v", p['bitrate']]
+    else: args += ["-crf", str(p['crf'])]
+    if p.get("maxrate"): args += ["-maxrate", p['maxrate'], "-bufsize", p['bufsize']]
+    return args + ["-g", str(p['gop']), "-threads", str(p['threads']), "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", p['audio']]
+
+def reel_profiles(crop=True, proxy=False, profile=None, landscape_profile=None):
+    """(main output profile, Landscape output profile) - explicit choices win, otherwise by format."""
+    main = profile or ("preview" if proxy else ("short-final" if crop else "landscape-final"))
+    return main, landscape_profile or "landscape-final"
+
+def encode_report(path, profile, duration, elapsed):
+    """Measured result of one encode: size, average bitrate and speed (x realtime)."""
+    size = os.path.getsize(path)
+    return {
+        "file": os.path.basename(path), "profile": profile, "size_kb": round(size / 1024, 1),
+        "kbps": round(size * 8 / 1000 / max(float(duration), 0.001)), "encode_s": round(elapsed, 2),
+        "speed": round(float(duration) / elapsed, 2) if elapsed > 0 else None
     }
 
-    selected_filter = fx_map.get(effect, "")
-    final_filter = f"{base}{selected_filter}"
+def build_reel_cmd(video_url, start_time_sec, duration, effect, output_filename, crop=True, landscape_filename=None, proxy=False, profile=None, landscape_profile=None):
+    """
+    Builds the ffmpeg command line for a reel (shared by the live renderer and the job queue).
+    With landscape_filename set, the source is decoded ONCE and split into the 1080x1920 Short
+    (output_filename) and the 1920x1080 padded Landscape (landscape_filename).
+    proxy=True renders a 360p throwaway preview instead (single output only).
+    profile / landscape_profile pick ENCODER_PROFILES entries (default: by output format).
+    """
+    video_url = direct_dropbox_url(video_url)
 
+    selected_filter = REEL_FX_MAP.get(effect, "")
+    main_profile, land_profile = reel_profiles(crop, proxy, profile, landscape_profile)
     cmd = [
         "ffmpeg", "-y",
         "-ss", str(start_time_sec),
         "-t", str(duration),
-        "-i", video_url,
-        "-vf", final_filter,
-        "-c:v", "libx264", 
-        "-preset", "ultrafast", 
-        "-crf", "28",
-        "-pix_fmt", "yuv420p",
-        "-c:a", "aac",
-        output_filename
+        "-i", video_url
     ]
-    
+
+    if proxy:
+        return cmd + ["-vf", f"{reel_base_filter(crop, proxy=True)}{selected_filter}"] + encode_args(main_profile) + [output_filename]
+
+    if not landscape_filename:
+        final_filter = f"{reel_base_filter(crop)}{selected_filter}"
+        return cmd + ["-vf", final_filter] + encode_args(main_profile) + [output_filename]
+
+    # DUAL OUTPUT: one decode, split filtergraph, effect applied per branch (matches single renders exactly)
+    graph = (
+        f"[0:v]split=2[v_s][v_l];"
+        f"[v_s]{reel_base_filter(True)}{selected_filter}[short];"
+        f"[v_l]{reel_base_filter(False)}{selected_filter}[land]"
+    )
+    return cmd + [
+        "-filter_complex", graph,
+        "-map", "[short]", "-map", "0:a?"] + encode_args(main_profile) + [output_filename] + [
+        "-map", "[land]", "-map", "0:a?"] + encode_args(land_profile) + [landscape_filename]
+
+def _ffmpeg_seconds(value):
+    """ffmpeg -progress reports out_time_us (and the misnamed out_time_ms) in microseconds."""
+    try: return int(value) / 1_000_000
+    except (TypeError, ValueError): return None
+
+def run_ffmpeg(cmd, timeout=None, job=None):
+    """
+    Runs one ffmpeg command. Raises RuntimeError (with ffmpeg's own reason) or TimeoutExpired.
+    With a queue job, ffmpeg's machine-readable -progress stream is parsed into job['progress']
+    (frame, fps, encoded time, speed, ETA) and job['cancel'] stops the process mid-render.
+    """
+    if job is None:
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+        except subprocess.CalledProcessError as e:
+            # Last line of ffmpeg's stderr is usually the actual reason
+            err_tail = e.stderr.decode(errors="ignore").strip().splitlines()[-1:] if e.stderr else []
+            raise RuntimeError(f"ffmpeg exited with code {e.returncode}: {' '.join(err_tail)}") from e
+        return
+
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    started = tm.time()
+    # stderr goes to a file: a second pipe could fill up and deadlock while we read stdout
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file, text=True)
+        job['proc'] = proc
+        stats = {}
+        timed_out = False
+        try:
+            for line in proc.stdout:
+                key, _, value = line.strip().partition("=")
+                stats[key] = value
+                if key != "progress": continue
+                # One full block received - publish it
+                out_time = _ffmpeg_seconds(stats.get("out_time_us") or stats.get("out_time_ms"))
+                try: speed = float(stats.get("speed", "").rstrip("x"))
+                except ValueError: speed = None
+                total = float(job['dur']) or None
+                job['progress'] = {
+                    "frame": int(stats.get("frame", 0) or 0),
+                    "fps": float(stats.get("fps", 0) or 0),
+                    "out_time": out_time, "speed": speed,
+                    "pct": min(1.0, out_time / total) if (out_time and total) else 0.0,
+                    "eta": (total - out_time) / speed if (out_time is not None and total and speed) else None
+                }
+                timed_out = bool(timeout and tm.time() - started > timeout)
+                if job.get("cancel") or timed_out:
+                    proc.terminate(); break
+            proc.wait()
+        finally:
+            job['proc'] = None
+            if proc.poll() is None: proc.kill(); proc.wait()
+        if job.get("cancel"): raise RuntimeError("Cancelled")
+        if timed_out: raise subprocess.TimeoutExpired(cmd, timeout)
+        if proc.returncode != 0:
+            err_file.seek(0)
+            err_tail = err_file.read().decode(errors="ignore").strip().splitlines()[-1:]
+            raise RuntimeError(f"ffmpeg exited with code {proc.returncode}: {' '.join(err_tail)}")
+
+# --- FAST CUTS (STREAM COPY) ---
+def can_stream_copy(info, effect, crop=True):
+    """A cut needs no filter when there is no effect and the source already IS the target format."""
+    if not info or REEL_FX_MAP.get(effect, ""): return False
+    target = (1080, 1920) if crop else (1920, 1080)
+    return ((info['width'], info['height']) == target and info['vcodec'] == "h264" and info['pix_fmt'] == "yuv420p"
+            and not info.get("rotation"))
+
+def next_keyframe(info, start_time_sec, duration):
+    """First keyframe inside (start, start + duration), from the metadata index. None if the clip has none."""
+    kf = info.get("keyframes") or []
+    i = int(np.searchsorted(kf, start_time_sec, side="right"))
+    return kf[i] if i < len(kf) and kf[i] < start_time_sec + duration else None
+
+# ffprobe profile name -> x264 -profile:v (the only H.264 profiles a yuv420p 8-bit source can carry)
+X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+def _h264_params(path):
+    """(x264 profile, level, pix_fmt, width, height) of the first video stream, for seam checks."""
+    out = subprocess.run([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=profile,level,pix_fmt,width,height", "-of", "json", path
+    ], check=True, capture_output=True, timeout=30).stdout
+    s = (json.loads(out).get("streams") or [{}])[0]
+    return (X264_PROFILES.get(s.get("profile")), int(s.get("level") or 0), s.get("pix_fmt"), s.get("width"), s.get("height"))
+
+def fast_cut(source, start_time_sec, duration, output_filename, info, smart=False, timeout=None, job=None):
+    """
+    Plain trim without a transcode. Returns False (nothing written) if a smart seam can't be made safely.
+    - copy: snaps to the keyframe at/before start (may begin a fraction of a second early).
+    - smart: re-encodes only the partial GOP up to the next keyframe - to the source's profile, level and
+      pix_fmt - stream-copies the rest, and joins both through MPEG-TS so each side carries its own
+      SPS/PPS in-band at the seam.
+    """
+    audio = ["-c:a", "copy"] if info.get("acodec") == "aac" else ["-c:a", "aac"]
+    maps = ["-map", "0:v:0", "-map", "0:a?"]
+    kf = next_keyframe(info, start_time_sec, duration) if smart else None
+
+    if kf is None or kf - start_time_sec < 0.05:
+        run_ffmpeg(["ffmpeg", "-y", "-ss", str(start_time_sec), "-i", source, "-t", str(duration)]
+                   + maps + ["-c:v", "copy"] + audio + ["-avoid_negative_ts", "make_zero", "-movflags", "+faststart", output_filename], timeout=timeout, job=job)
+        return True
+
+    # Older index entries have no profile/level: no way to match the head, so let the caller encode
+    profile = X264_PROFILES.get(info.get("vprofile"))
+    if not profile or not info.get("level"): return False
+    stem = os.path.splitext(output_filename)[0]
+    head, tail = f"{stem}_head.ts", f"{stem}_tail.ts"
+    try:
+        # Head: frame-accurate start, high quality, same profile / level / pix_fmt as the copied tail
+        run_ffmpeg(["ffmpeg", "-y", "-ss", str(start_time_sec), "-i", source, "-t", str(kf - start_time_sec)]
+                   + maps + ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", info['pix_fmt'],
+                             "-profile:v", profile, "-level:v", f"{info['level'] / 10:.1f}", "-c:a", "aac", "-f", "mpegts", head], timeout=timeout, job=job)
+        if _h264_params(head) != _h264_params(source): return False
+        # Tail: untouched packets from the keyframe onwards (+1ms so the seek lands ON the keyframe)
+        run_ffmpeg(["ffmpeg", "-y", "-ss", str(kf + 0.001), "-i", source, "-t", str(start_time_sec + duration - kf)]
+                   + maps + ["-c:v", "copy", "-bsf:v", "h264_mp4toannexb"] + audio + ["-f", "mpegts", tail], timeout=timeout, job=job)
+        run_ffmpeg(["ffmpeg", "-y", "-i", f"concat:{head}|{tail}", "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+                    "-bsf:a", "aac_adtstoasc", "-movflags", "+faststart", output_filename], timeout=timeout, job=job)
+        return True
+    finally:
+        for path in (head, tail):
+            if os.path.exists(path): os.remove(path)
+
+def run_reel_render(video_url, start_time_sec, duration, effect, output_filename, crop=True, timeout=None, landscape_filename=None, cut_mode="auto", proxy=False, job=None, profile=None, landscape_profile=None, stats=None):
+    """
+    Renders without touching the UI, so it is safe inside worker threads. Raises RuntimeError on failure.
+    cut_mode: "auto" stream-copies when no filter is needed, "smart" does the same with a
+    frame-accurate start, "encode" always transcodes.
+    Returns how it was made: "copy" (full quality, no transcode), "proxy" or "encode".
+    Pass the queue job to get live progress on it and to make it cancellable.
+    Pass a list as stats to get an encode_report() per file produced.
+    """
+    # Reads through the source cache (the download happens here, i.e. in the worker, not the page)
+    source = local_source(video_url)
+    main_profile, land_profile = reel_profiles(crop, proxy, profile, landscape_profile)
+    report = stats if stats is not None else []
+
+    meta = video_meta(video_url)
+    if meta and meta['duration']:
+        # Exact bounds from the index: never ask ffmpeg for time past the end of the source
+        start_time_sec = min(float(start_time_sec), max(0.0, meta['duration'] - 0.1))
+        duration = min(float(duration), meta['duration'] - start_time_sec)
+    info = meta if cut_mode != "encode" else None
+    started = tm.perf_counter()
+    # Only a smart cut that can actually stream-copy pays for the keyframe scan
+    if can_stream_copy(info, effect, crop) and cut_mode == "smart": info = {**info, "keyframes": video_keyframes(video_url)}
+    if can_stream_copy(info, effect, crop) and fast_cut(source, start_time_sec, duration, output_filename, info, smart=(cut_mode == "smart"), timeout=timeout, job=job):
+        report.append(encode_report(output_filename, "smart-cut" if cut_mode == "smart" else "stream-copy", duration, tm.perf_counter() - started))
+        if landscape_filename:
+            # The Short cost no decode at all, so the Landscape is the only real render left
+            started = tm.perf_counter()
+            run_ffmpeg(build_reel_cmd(source, start_time_sec, duration, effect, landscape_filename, crop=False, profile=land_profile), timeout=timeout, job=job)
+            report.append(encode_report(landscape_filename, land_profile, duration, tm.perf_counter() - started))
+        return "copy"
+
+    landscape_filename = None if proxy else landscape_filename
+    cmd = build_reel_cmd(source, start_time_sec, duration, effect, output_filename, crop=crop, landscape_filename=landscape_filename, proxy=proxy, profile=main_profile, landscape_profile=land_profile)
+    started = tm.perf_counter()
+    run_ffmpeg(cmd, timeout=timeout, job=job)
+    # Dual output shares one pass, so both files report the same encode time
+    elapsed = tm.perf_counter() - started
+    report.append(encode_report(output_filename, main_profile, duration, elapsed))
+    if landscape_filename: report.append(encode_report(landscape_filename, land_profile, duration, elapsed))
+    return "proxy" if proxy else "encode"
+
+def process_reel(video_url, start_time_sec, duration, effect, output_filename, crop=True, timeout=120, landscape_filename=None, cut_mode="auto", profile=None):
+    """
+    Renders video. If crop=False, it fits video into 1920x1080 with black bars (No Crop).
+    Pass landscape_filename to get the Short AND the Landscape from a single decode.
+    """
     try:
-        # Increased timeout to 120s to prevent Streamlit killing it
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=120)
+        # Default 120s timeout keeps inline (blocking) renders from hanging the page forever
+        run_reel_render(video_url, start_time_sec, duration, effect, output_filename, crop=crop, timeout=timeout, landscape_filename=landscape_filename, cut_mode=cut_mode, profile=profile)
         return True
-    except subprocess.CalledProcessError as e:
+    except RuntimeError as e:
         st.error(f"Render Failed: {e}")
         return False
     except subprocess.TimeoutExpired:
         st.error("Render timed out. Try a shorter clip.")
         return False
-        
+
+# --- RENDER CACHE (IDENTICAL RENDERS COME BACK INSTANTLY) ---
+RENDER_CACHE_DIR = os.path.join(CACHE_ROOT, "renders")
+RENDER_CACHE_MAX_BYTES = int(float(st.secrets.get("RENDER_CACHE_GB", 4)) * 1024**3)
+
+def source_identity(video_url):
+    """Content hash of the cached source when we have it, otherwise the normalized URL key."""
+    if not video_url.startswith("http"):
+        info = os.stat(video_url)
+        return f"{os.path.abspath(video_url)}:{info.st_size}:{int(info.st_mtime)}"
+    key = source_cache_key(video_url)
+    blob = _resolve_source_ref(os.path.join(SOURCE_CACHE_DIR, f"{key}.ref"))
+    return os.path.basename(blob) if blob and not blob.startswith("http") else key
+
+def render_cache_key(job):
+    """Everything that changes the output bytes: source, cut, effect, format and encoder settings."""
+    settings = {
+        "src": source_identity(job['url']), "ts": round(float(job['ts']), 3), "dur": round(float(job['dur']), 3),
+        "fx": job['fx'], "crop": job['crop'], "landscape": bool(job['landscape_output']),
+        "cut": job['cut_mode'], "proxy": job['proxy'],
+        "enc": [encode_args(p) for p in reel_profiles(job['crop'], job['proxy'], job['profile'])]
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:32]
+
+def _link_or_copy(src, dest):
+    """Hard link when possible (free), copy otherwise. Callers may delete dest without hurting src."""
+    if os.path.exists(dest): os.remove(dest)
+    try: os.link(src, dest)
+    except OSError: shutil.copy2(src, dest)
+
+def _render_cache_files(key, job):
+    files = [(os.path.join(RENDER_CACHE_DIR, f"{key}.mp4"), job['output'])]
+    if job['landscape_output']:
+        files.append((os.path.join(RENDER_CACHE_DIR, f"{key}_full.mp4"), job['landscape_output']))
+    return files
+
+def render_cache_fetch(key, job):
+    """Materialises a cached render at the job's own output paths. Returns its mode, or None on a miss."""
+    meta_path = os.path.join(RENDER_CACHE_DIR, f"{key}.json")
+    try:
+        with open(meta_path) as f: meta = json.load(f)
+    except (OSError, ValueError): return None
+    files = _render_cache_files(key, job)
+    if not all(os.path.exists(cached) for cached, _ in files): return None
+    try:
+        for cached, dest in files:
+            _link_or_copy(cached, dest)
+            os.utime(cached, None) # LRU touch
+    except OSError: return None
+    os.utime(meta_path, None)
+    job['encode_stats'] = meta.get("stats", [])
+    return meta.get("mode")
+
+def render_cache_store(key, job):
+    """Keeps a finished render for next time, then trims the cache back under its quota."""
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    try:
+        for cached, produced in _render_cache_files(key, job):
+            _link_or_copy(produced, cached)
+        with open(os.path.join(RENDER_CACHE_DIR, f"{key}.json"), "w") as f:
+            json.dump({"mode": job['mode'], "stats": job['encode_stats'], "created": tm.time()}, f)
+    except OSError: return
+    evict_lru(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES, (".mp4", ".json"))
+
+# --- RENDER QUEUE (BACKGROUND FFMPEG WORKERS) ---
+# ffmpeg is multi-threaded itself, so half the cores as parallel jobs keeps the box responsive
+RENDER_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Batches get their own pool, so a PREVIEW / APPROVE never queues behind a 20-clip batch
+BATCH_RENDER_WORKERS = max(1, RENDER_WORKERS // 2)
+APPROVE_RENDER_TIMEOUT = 10 * 60 # APPROVE blocks the page while the full-quality render runs
+RENDER_DIR = os.path.join(tempfile.gettempdir(), "ghost_renders")
+RENDER_JOB_TTL = 2 * 60 * 60 # Finished jobs (and their files) are dropped after 2 hours
+
+@st.cache_resource
+def get_render_queue():
+    """One worker pool per server process, so jobs survive reruns and are shared across sessions."""
+    os.makedirs(RENDER_DIR, exist_ok=True)
+    return {
+        "pool": ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render"),
+        "batch_pool": ThreadPoolExecutor(max_workers=BATCH_RENDER_WORKERS, thread_name_prefix="batch"),
+        # Batch uploads are network I/O - they never hold a render slot
+        "upload_pool": ThreadPoolExecutor(max_workers=UPLOAD_PARALLEL, thread_name_prefix="upload"),
+        "jobs": {},
+        "batches": {},
+        "lock": threading.Lock()
+    }
+
+def _run_render_job(job):
+    """Worker body. Never calls st.* (no script context in pool threads) - results go on the job dict."""
+    if job.get("cancel"): # Cancelled while still queued
+        if job.get("batch"): get_render_queue()['upload_pool'].submit(_vault_batch_job, job)
+        return
+    job['status'] = "running"
+    job['started'] = tm.time()
+    try:
+        # Resolve the source first so the cache key is its content hash (same file via another link = hit)
+        local_source(job['url'])
+        key = render_cache_key(job)
+        cached_mode = render_cache_fetch(key, job)
+        if cached_mode:
+            job['mode'], job['cached'] = cached_mode, True
+        else:
+            job['mode'] = run_reel_render(job['url'], job['ts'], job['dur'], job['fx'], job['output'], crop=job['crop'], landscape_filename=job['landscape_output'], cut_mode=job['cut_mode'], proxy=job['proxy'], job=job, profile=job['profile'], stats=job['encode_stats'])
+            render_cache_store(key, job)
+        job['status'] = "done"
+    except Exception as e:
+        # Partial output from a killed ffmpeg is junk either way
+        job['status'] = "cancelled" if job.get("cancel") else "failed"
+        job['error'] = str(e)
+        for path in (job['output'], job['landscape_output']):
+            if path and os.path.exists(path): os.remove(path)
+    job['finished'] = tm.time()
+    if job.get("batch"): get_render_queue()['upload_pool'].submit(_vault_batch_job, job)
+
+def _prune_render_jobs(queue):
+    """Forgets finished jobs older than RENDER_JOB_TTL and deletes their leftover files."""
+    cutoff = tm.time() - RENDER_JOB_TTL
+    with queue['lock']:
+        stale = [jid for jid, j in queue['jobs'].items() if j['finished'] and j['finished'] < cutoff]
+        for jid in stale:
+            job = queue['jobs'].pop(jid)
+            for path in (job['output'], job['landscape_output']):
+                if path and os.path.exists(path):
+                    try: os.remove(path)
+                    except OSError: pass
+        for bid in [bid for bid, b in queue['batches'].items() if b['finished'] and b['finished'] < cutoff]:
+            del queue['batches'][bid]
+
+def submit_render_job(video_url, start_time_sec, duration, effect, crop=True, landscape=False, cut_mode="auto", proxy=False, batch=None, profile=None):
+    """
+    Queues a render and returns its job id immediately. Poll with get_render_job().
+    landscape=True also produces the 1920x1080 version in the same ffmpeg pass (Short must be cropped).
+    proxy=True makes a 360p preview; the full-quality render is deferred to approval.
+    batch=<batch id> vaults the result straight to Dropbox when it finishes (see submit_render_batch).
+    profile overrides the main output's ENCODER_PROFILES entry; measured results land in job['encode_stats'].
+    """
+    queue = get_render_queue()
+    _prune_render_jobs(queue)
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        "id": job_id, "url": video_url, "ts": start_time_sec, "dur": duration, "fx": effect, "crop": crop, "cut_mode": cut_mode,
+        "status": "queued", "output": os.path.join(RENDER_DIR, f"reel_{job_id}.mp4"), "error": None,
+        "landscape_output": os.path.join(RENDER_DIR, f"reel_{job_id}_full.mp4") if (landscape and crop and not proxy) else None,
+        "proxy": proxy, "profile": profile, "mode": None, "cached": False, "encode_stats": [],
+        "progress": None, "proc": None, "cancel": False, "batch": batch,
+        "submitted": tm.time(), "started": None, "finished": None
+    }
+    # Identical render already on disk? Done before it ever reaches the pool.
+    try: cached_mode = render_cache_fetch(render_cache_key(job), job)
+    except OSError: cached_mode = None
+    if cached_mode:
+        job.update(status="done", mode=cached_mode, cached=True, started=job['submitted'], finished=tm.time())
+    with queue['lock']:
+        queue['jobs'][job_id] = job
+    if not cached_mode: queue['batch_pool' if batch else 'pool'].submit(_run_render_job, job)
+    elif batch: queue['upload_pool'].submit(_vault_batch_job, job) # Cache hit still has to be uploaded
+    return job_id
+
+def get_render_job(job_id):
+    """Returns the job dict (status: queued / running / done / failed) or None if it was pruned."""
+    return get_render_queue()['jobs'].get(job_id)
+
+def cancel_render_job(job_id):
+    """Stops a queued/running render. The worker deletes the partial output when ffmpeg exits."""
+    job = get_render_job(job_id)
+    if not job or job['status'] not in ("queued", "running"): return
+    job['cancel'] = True
+    if job['status'] == "queued":
+        job.update(status="cancelled", finished=tm.time())
+    proc = job.get("proc")
+    if proc and proc.poll() is None: proc.terminate()
+
+def wait_for_render_job(job_id, poll=0.5, timeout=None):
+    """Blocks until the job finishes (used where the page has to wait anyway, e.g. APPROVE). Cancels it past timeout."""
+    job = get_render_job(job_id)
+    deadline = tm.time() + timeout if timeout else None
+    while job and job['status'] in ("queued", "running"):
+        if deadline and tm.time() > deadline:
+            cancel_render_job(job_id)
+            job['error'] = job['error'] or f"gave up after {timeout}s"
+            break
+        tm.sleep(poll)
+    return job
+
+def render_jobs_in_flight():
+    return sum(1 for j in list(get_render_queue()['jobs'].values()) if j['status'] in ("queued", "running"))
+
+def sync_preview_job():
+    """Moves a finished background preview into the MONITOR. Returns the job while it is still in flight."""
+    job_id = st.session_state.get("preview_job")
+    if not job_id: return None
+    job = get_render_job(job_id)
+    if job is None:
+        del st.session_state.preview_job; return None
+    if job['status'] == "done":
+        # Replace (and clean up) any older preview this session was showing
+        if st.session_state.get("preview_reel_path") != job['output']: clear_preview()
+        st.session_state.preview_reel_path = job['output']
+        if job['landscape_output']: st.session_state.preview_landscape_path = job['landscape_output']
+        st.session_state.preview_is_proxy = job['mode'] == "proxy"
+        st.session_state.preview_stats = job['encode_stats']
+        del st.session_state.preview_job
+        return None
+    if job['status'] == "failed":
+        st.error(f"Render Failed: {job['error']}")
+        del st.session_state.preview_job
+        return None
+    if job['status'] == "cancelled":
+        st.info("🛑 Render cancelled.")
+        del st.session_state.preview_job
+        return None
+    return job
+
+def clear_preview():
+    """Deletes this session's preview files (Short + any Landscape rendered alongside it), and any upload left to resume."""
+    for asset in st.session_state.pop("pending_vault", []):
+        if os.path.exists(asset['path']): os.remove(asset['path'])
+    for key in ("preview_reel_path", "preview_landscape_path"):
+        path = st.session_state.pop(key, None)
+        if path and os.path.exists(path): os.remove(path)
+    st.session_state.pop("preview_is_proxy", None)
+    st.session_state.pop("preview_stats", None)
+
+def finalize_preview(params, save_full, status):
+    """
+    Full-quality files for the approved preview: (short_path, landscape_path).
+    Proxy previews are rendered properly here - once, Short + Landscape from one decode.
+    """
+    if not st.session_state.get("preview_is_proxy") or not params:
+        return st.session_state.get("preview_reel_path"), st.session_state.get("preview_landscape_path")
+    status.write("🎬 Rendering Full Quality...")
+    job = wait_for_render_job(submit_render_job(params['url'], params['ts'], params['dur'], params['fx'], crop=True, landscape=save_full, profile=params.get('profile')), timeout=APPROVE_RENDER_TIMEOUT)
+    if not job or job['status'] != "done":
+        status.write(f"❌ Render Failed: {job['error'] if job else 'job lost'}")
+        return None, None
+    for s in job['encode_stats']: status.write(f"📊 {encode_stats_line(s)}")
+    return job['output'], job['landscape_output']
+
+def vault_pending_assets(status):
+    """
+    Uploads st.session_state.pending_vault ([{'path', 'name', 'done'}], committed together) and records each one.
+    Anything that fails stays listed - file and upload checkpoint kept - so the next APPROVE resumes it
+    with the same name. Returns True once nothing is left.
+    """
+    pending = st.session_state.get("pending_vault", [])
+    if pending: status.write("☁️ Uploading...")
+    left = []
+    for asset, url in zip(pending, upload_assets_to_social_system([(a['path'], a['name']) for a in pending])):
+        if not url:
+            left.append(asset); continue
+        supabase.table("uploaded_images").insert({"file_url": url, "filename": asset['name'], "media_type": "video"}).execute()
+        status.write(asset['done'])
+        # The preview itself stays on screen until everything is in
+        if asset['path'] != st.session_state.get("preview_reel_path") and os.path.exists(asset['path']): os.remove(asset['path'])
+    if left:
+        st.session_state.pending_vault = left
+        return False
+    st.session_state.pop("pending_vault", None)
+    return True
+
+def encode_stats_line(s):
+    speed = f"{s['speed']}x" if s['speed'] else "?"
+    return f"{s['profile']}: {s['size_kb'] / 1024:.1f} MB • {s['kbps']} kbps • {s['encode_s']}s ({speed} realtime)"
+
+# --- BATCH RENDER (MANY GRID MOMENTS, ONE CLICK) ---
+def submit_render_batch(video_url, timestamps, duration, effect, landscape=True, profile=None):
+    """
+    Queues one full-quality render per timestamp and returns the batch id.
+    The shared pool caps concurrency (RENDER_WORKERS); each finished clip is uploaded by its worker,
+    and the uploaded_images rows go in as a single bulk insert once the last clip is done.
+    """
+    queue = get_render_queue()
+    batch_id = uuid.uuid4().hex[:12]
+    batch = {
+        "id": batch_id, "fx": effect, "dur": duration, "jobs": [], "remaining": len(timestamps),
+        "rows": [], "vaulted": 0, "failed": [], "pending": [], "error": None,
+        "submitted": tm.time(), "finished": None
+    }
+    with queue['lock']:
+        queue['batches'][batch_id] = batch
+    for ts in timestamps:
+        batch['jobs'].append(submit_render_job(video_url, ts, duration, effect, crop=True, landscape=landscape, batch=batch_id, profile=profile))
+    return batch_id
+
+def get_render_batch(batch_id):
+    return get_render_queue()['batches'].get(batch_id)
+
+def _vault_batch_job(job):
+    """Worker body: uploads one finished batch clip, then records the whole batch when it is the last one."""
+    queue = get_render_queue()
+    batch = queue['batches'].get(job['batch'])
+    if batch is None: return
+    rows, pending = [], []
+    if job['status'] == "done":
+        stamp = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{job['id'][:6]}"
+        for path, fname in ((job['output'], f"reel_short_{stamp}.mp4"), (job['landscape_output'], f"reel_full_{stamp}.mp4")):
+            if not path or not os.path.exists(path): continue
+            url = upload_to_social_system(path, fname) # st.error inside is a no-op off the script thread
+            if url:
+                rows.append({"file_url": url, "filename": fname, "media_type": "video"}); os.remove(path)
+            else: pending.append((path, fname)) # Kept (with its upload checkpoint) for RETRY UPLOADS
+        if not rows: job['error'] = "Dropbox upload failed"
+    with queue['lock']:
+        batch['rows'].extend(rows)
+        batch['pending'].extend(pending)
+        if job['status'] != "done" or not rows:
+            batch['failed'].append(f"{job['ts']:.1f}s: {job['error'] or job['status']}")
+        batch['remaining'] -= 1
+        last = batch['remaining'] == 0
+    if not last: return
+    try:
+        if batch['rows']: supabase.table("uploaded_images").insert(batch['rows']).execute()
+        batch['vaulted'] = len(batch['rows'])
+    except Exception as e:
+        batch['error'] = f"Database insert failed: {e}"
+    batch['finished'] = tm.time()
+
+def retry_batch_uploads(batch):
+    """Re-uploads clips whose upload failed (resuming their sessions, same names) and records the ones that land."""
+    still, rows = [], []
+    for path, fname in batch['pending']:
+        url = upload_to_social_system(path, fname) if os.path.exists(path) else None
+        if url:
+            rows.append({"file_url": url, "filename": fname, "media_type": "video"}); os.remove(path)
+        elif os.path.exists(path): still.append((path, fname))
+    if rows:
+        supabase.table("uploaded_images").insert(rows).execute()
+        batch['vaulted'] += len(rows)
+    batch['pending'] = still
+
+def cancel_render_batch(batch_id):
+    batch = get_render_batch(batch_id)
+    if batch:
+        for job_id in batch['jobs']: cancel_render_job(job_id)
+
+@st.fragment(run_every=1.0)
+def render_batch_banner(batch_id):
+    """Progress strip for a batch, polled once a second; reruns the page when it finishes or is dismissed."""
+    batch = get_render_batch(batch_id)
+    if batch is None or st.session_state.get("render_batch_dismissed") == batch_id:
+        st.session_state.pop("render_batch", None); st.session_state.pop("render_batch_dismissed", None)
+        st.rerun()
+    if batch['finished'] and st.session_state.get("render_batch_done") != batch_id:
+        st.session_state.render_batch_done = batch_id; st.rerun()
+    jobs = [j for j in (get_render_job(jid) for jid in batch['jobs']) if j]
+    done = len(batch['jobs']) - batch['remaining']
+    running = sum(1 for j in jobs if j['status'] == "running")
+    c_msg, c_btn = st.columns([3, 1])
+    with c_msg:
+        if batch['finished']:
+            if batch['error']: st.error(f"📦 Batch: {batch['error']}")
+            else: st.success(f"📦 Batch complete: {batch['vaulted']} file(s) vaulted from {len(batch['jobs'])} clip(s).")
+        else:
+            st.info(f"📦 Batch ({batch['fx']}, {batch['dur']}s): {done}/{len(batch['jobs'])} finished • {running} rendering • {int(tm.time() - batch['submitted'])}s elapsed")
+            st.progress(done / max(1, len(batch['jobs'])))
+        for msg in batch['failed']: st.caption(f"⚠️ {msg}")
+        if batch['finished'] and batch['pending']: st.warning(f"☁️ {len(batch['pending'])} rendered file(s) didn't upload - RETRY resumes them.")
+    with c_btn:
+        if batch['finished']:
+            if batch['pending'] and st.button("🔁 RETRY UPLOADS", key="batch_retry", use_container_width=True):
+                with st.spinner("Uploading..."):
+                    try: retry_batch_uploads(batch)
+                    except Exception as e: st.error(f"Database Error: {e}")
+            if st.button("✖️ DISMISS", key="batch_dismiss", use_container_width=True):
+                # Giving up on anything still pending: its checkpoint is pruned once the file is gone
+                for path, _ in batch['pending']:
+                    if os.path.exists(path): os.remove(path)
+                batch['pending'] = []
+                st.session_state.render_batch_dismissed = batch_id; st.rerun()
+        else:
+            if st.button("🛑 CANCEL BATCH", key="batch_cancel", use_container_width=True):
+                cancel_render_batch(batch_id); st.rerun()
+
+@st.fragment(run_every=1.0)
+def render_job_banner(job_id, key):
+    """Status strip for a queued/running render, polled once a second. Reruns the page once the job is over."""
+    job = get_render_job(job_id)
+    if job is None or job['status'] not in ("queued", "running"):
+        st.rerun()
+    c_msg, c_btn = st.columns([3, 1])
+    with c_msg:
+        label = "⏳ Queued" if job['status'] == "queued" else "⚙️ Rendering"
+        elapsed = int(tm.time() - job['submitted'])
+        st.info(f"{label} @ {job['ts']:.1f}s for {job['dur']}s ({job['fx']}) • {elapsed}s elapsed • {render_jobs_in_flight()} job(s) in flight")
+        prog = job.get("progress")
+        if prog:
+            eta = f"{prog['eta']:.0f}s" if prog['eta'] is not None else "?"
+            speed = f"{prog['speed']:.2f}x" if prog['speed'] else "?"
+            encoded = f"{prog['out_time']:.1f}s" if prog['out_time'] is not None else "0s"
+            st.progress(prog['pct'], text=f"🎞️ {prog['frame']} frames • {prog['fps']:.0f} fps • {encoded} encoded • {speed} • ETA {eta}")
+    with c_btn:
+        if st.button("🛑 CANCEL", key=f"rcan_{key}", use_container_width=True):
+            cancel_render_job(job['id']); st.rerun()
+
+# --- RENDER BENCHMARK (SYNTHETIC SOURCES, EVERY EFFECT) ---
+BENCH_DIR = os.path.join(CACHE_ROOT, "bench")
+BENCH_FPS = 30
+BENCH_RESOLUTIONS = ["640x360", "1280x720", "1920x1080", "3840x2160"]
+
+def make_bench_source(resolution, seconds):
+    """Deterministic test clip (testsrc2 picture + pink-noise audio). Built once per size/length."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"src_{resolution}_{seconds}s.mp4")
+    if not os.path.exists(path):
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.part.mp4"
+        run_ffmpeg([
+            "ffmpeg", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate={BENCH_FPS}:duration={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=d={seconds}:c=pink:r=44100:a=0.3",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-g", str(BENCH_FPS * 2),
+            "-c:a", "aac", "-shortest", tmp
+        ])
+        os.replace(tmp, path)
+    return path
+
+def timed_ffmpeg(cmd):
+    """Runs ffmpeg and returns (wall seconds, CPU seconds of the ffmpeg process itself)."""
+    with tempfile.TemporaryFile() as err_file:
+        started = tm.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=err_file)
+        # wait4 reaps the child and hands back its rusage (user + system time across all encoder threads)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = tm.perf_counter() - started
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            err_file.seek(0)
+            err_tail = err_file.read().decode(errors="ignore").strip().splitlines()[-1:]
+            raise RuntimeError(f"ffmpeg exited with code {proc.returncode}: {' '.join(err_tail)}")
+    return wall, usage.ru_utime + usage.ru_stime
+
+def run_render_benchmark(resolutions, durations, effects, crops, profile=None):
+    """
+    Renders every effect x crop mode against each synthetic source with the live encoder settings
+    (or one ENCODER_PROFILES entry for all of them).
+    Yields one result row per render so the page can show progress as it goes.
+    """
+    for res in resolutions:
+        for seconds in durations:
+            source = make_bench_source(res, seconds)
+            for effect in effects:
+                for crop in crops:
+                    out = os.path.join(BENCH_DIR, f"out_{uuid.uuid4().hex[:8]}.mp4")
+                    row = {"source": f"{res}@{seconds}s", "effect": effect, "output": "short" if crop else "landscape", "profile": reel_profiles(crop, profile=profile)[0]}
+                    try:
+                        wall, cpu = timed_ffmpeg(build_reel_cmd(source, 0, seconds, effect, out, crop=crop, profile=profile))
+                        row.update(wall_s=round(wall, 3), cpu_s=round(cpu, 3), fps=round(seconds * BENCH_FPS / wall, 1),
+                                   size_kb=round(os.path.getsize(out) / 1024, 1), error=None)
+                    except Exception as e:
+                        row.update(wall_s=None, cpu_s=None, fps=None, size_kb=None, error=str(e))
+                    finally:
+                        if os.path.exists(out): os.remove(out)
+                    yield row
+
+def compare_benchmarks(rows, baseline, tolerance=0.10):
+    """Joins a run against a saved baseline on (source, effect, output, profile). Slower or bigger than tolerance = regression."""
+    base = {(b['source'], b['effect'], b['output'], b.get('profile')): b for b in baseline}
+    report = []
+    for r in rows:
+        b = base.get((r['source'], r['effect'], r['output'], r.get('profile')))
+        if not b or not r.get('wall_s') or not b.get('wall_s'): continue
+        wall_delta = r['wall_s'] / b['wall_s'] - 1
+        size_delta = (r['size_kb'] / b['size_kb'] - 1) if b.get('size_kb') else 0.0
+        report.append({
+            "source": r['source'], "effect": r['effect'], "output": r['output'], "profile": r.get('profile'),
+            "wall_s": r['wall_s'], "baseline_wall_s": b['wall_s'], "wall_%": round(wall_delta * 100, 1),
+            "size_%": round(size_delta * 100, 1),
+            "verdict": "🔴 REGRESSION" if (wall_delta > tolerance or size_delta > tolerance) else ("🟢 FASTER" if wall_delta < -tolerance else "⚪ SAME")
+        })
+    return report
 
 # --- DROPBOX HELPERS ---
 def get_video_duration(video_url):
-    if "dropbox.com" in video_url:
-        video_url = video_url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
+    """Exact duration in seconds from the metadata index. 0 (with a warning) if the source can't be probed."""
+    try: meta = video_meta(direct_dropbox_url(video_url))
+    except Exception: meta = None
+    if not meta or not meta['duration']:
+        st.warning("⚠️ Couldn't read this video's duration - check the link.")
+        return 0
+    return int(meta['duration'])
+
+def extract_frames_from_url(video_url, num_frames, strategy="auto"):
+    """Yields (PIL frame, timestamp) pairs as they decode. Raises on an unreadable source."""
+    source = local_source(direct_dropbox_url(video_url))
+    plan = plan_sampling(source, num_frames, strategy)
+    if plan: yield from iter_planned_frames(source, plan)
+
+# --- FRAME SAMPLER (EVENLY SPACED GRID FRAMES WITHOUT RANDOM SEEKS) ---
+SAMPLER_STRATEGIES = ["seek", "grab", "keyframe", "ffmpeg"]
+GRAB_MAX_GAP = 120 # Below ~4s between samples at 30fps, skipping forward beats seeking
+
+def _bgr_to_image(frame):
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+def _sample_seek(cap, indices, fps):
+    """Original approach: one random seek (keyframe + decode forward) per sample."""
+    for idx in indices:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        ret, frame = cap.read()
+        if ret: yield _bgr_to_image(frame), (idx / fps if fps > 0 else 0)
+
+def _sample_grab(cap, indices, fps):
+    """One forward pass: grab() demuxes/decodes without the colour conversion, retrieve() only on wanted frames."""
+    pos = 0
+    for idx in indices:
+        while pos < idx:
+            if not cap.grab(): return
+            pos += 1
+        ret, frame = cap.read(); pos += 1
+        if not ret: return
+        yield _bgr_to_image(frame), (idx / fps if fps > 0 else 0)
+
+def _sample_keyframes(cap, keyframes, num_frames, duration):
+    """Snaps each evenly spaced target to its nearest keyframe, so every seek decodes exactly one frame."""
+    kf = np.asarray(keyframes)
+    targets = np.linspace(0, duration, num_frames, endpoint=False)
+    pos = np.clip(np.searchsorted(kf, targets), 1, len(kf) - 1)
+    nearest = np.where(targets - kf[pos - 1] <= kf[pos] - targets, kf[pos - 1], kf[pos])
+    for t in np.unique(nearest):
+        cap.set(cv2.CAP_PROP_POS_MSEC, float(t) * 1000)
+        ret, frame = cap.read()
+        if ret: yield _bgr_to_image(frame), float(t)
+
+def _sample_ffmpeg(source, indices, fps):
+    """Single ffmpeg pass with a select filter, frames streamed back as BMPs (size is in each header)."""
+    expr = "+".join(f"eq(n\\,{i})" for i in indices)
+    proc = subprocess.Popen([
+        "ffmpeg", "-v", "error", "-i", source, "-vf", f"select={expr}", "-vsync", "0",
+        "-f", "image2pipe", "-c:v", "bmp", "pipe:1"
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for idx in indices:
+            head = proc.stdout.read(6)
+            if len(head) < 6: break
+            size = int.from_bytes(head[2:6], "little")
+            yield Image.open(io.BytesIO(head + proc.stdout.read(size - 6))).convert("RGB"), (idx / fps if fps > 0 else 0)
+    finally:
+        # Also runs when the consumer stops early (generator closed) - don't leave ffmpeg decoding
+        proc.stdout.close()
+        if proc.poll() is None: proc.kill()
+        proc.wait()
+
+def choose_sampler(source, total_frames, num_frames, keyframes):
+    """
+    Picks the cheapest way to get num_frames evenly spaced frames.
+    - grab: samples are close together, so reading straight through is cheaper than seeking.
+    - ffmpeg: still streaming over HTTP (not cached), one sequential read beats 50 range requests.
+    - keyframe: enough keyframes to land on, one decode per sample.
+    - seek: fallback (sparse keyframes, long gaps).
+    """
+    if total_frames / max(num_frames, 1) <= GRAB_MAX_GAP: return "grab"
+    if source.startswith("http"): return "ffmpeg"
+    if len(keyframes) >= num_frames: return "keyframe"
+    return "seek"
+
+def plan_sampling(source, num_frames, strategy="auto"):
+    """Works out the strategy and what it needs. None if the source has no readable frames."""
+    meta = video_meta(source)
+    if not meta or meta['frames'] <= 0: return None
+    total_frames, fps = meta['frames'], meta['fps']
+    keyframes = video_keyframes(source) if strategy in ("auto", "keyframe") else []
+    if strategy == "auto": strategy = choose_sampler(source, total_frames, num_frames, keyframes)
+    if strategy == "keyframe" and len(keyframes) < 2: strategy = "seek"
+    return {
+        "strategy": strategy, "fps": fps, "keyframes": keyframes, "num_frames": num_frames,
+        "indices": np.linspace(0, total_frames - 1, num_frames, dtype=int),
+        "duration": total_frames / fps if fps > 0 else (keyframes[-1] if keyframes else 0)
+    }
+
+def iter_planned_frames(source, plan):
+    """Yields (PIL frame, timestamp) in time order, each one as soon as it is decoded."""
+    if plan['strategy'] == "ffmpeg":
+        yield from _sample_ffmpeg(source, plan['indices'], plan['fps'])
+        return
+    cap = cv2.VideoCapture(source)
     try:
-        cap = cv2.VideoCapture(video_url)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        if plan['strategy'] == "grab": yield from _sample_grab(cap, plan['indices'], plan['fps'])
+        elif plan['strategy'] == "keyframe": yield from _sample_keyframes(cap, plan['keyframes'], plan['num_frames'], plan['duration'])
+        else: yield from _sample_seek(cap, plan['indices'], plan['fps'])
+    finally:
         cap.release()
-        if fps > 0: return int(frames / fps)
-        return 600
-    except: return 600
 
-def extract_frames_from_url(video_url, num_frames):
-    if "dropbox.com" in video_url:
-        video_url = video_url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
-    
+def sample_frames(source, num_frames, strategy="auto"):
+    """Returns (PIL frames, timestamps, strategy used). Raises on an unreadable source."""
+    plan = plan_sampling(source, num_frames, strategy)
+    if not plan: return [], [], strategy
+    pairs = list(iter_planned_frames(source, plan))
+    return [f for f, _ in pairs], [t for _, t in pairs], plan['strategy']
+
+def iter_frames_at_times(source, timestamps):
+    """
+    Full-res frames at arbitrary times, in one forward pass over a single capture.
+    Gaps up to GRAB_MAX_GAP frames are grabbed through (no seek); longer gaps seek, as _sample_grab vs _sample_seek.
+    """
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    pos = None # Frame index the next read() returns (unknown until the first seek)
     try:
-        cap = cv2.VideoCapture(video_url)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if total_frames <= 0: return [], 0
-        
-        indices = np.linspace(0, total_frames - 1, num_frames, dtype=int)
-        frames = []
-        timestamps = []
-        
-        for idx in indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        for t in sorted(timestamps):
+            idx = int(round(float(t) * fps)) if fps > 0 else None
+            if idx is None or pos is None or not 0 <= idx - pos <= GRAB_MAX_GAP:
+                cap.set(cv2.CAP_PROP_POS_MSEC, float(t) * 1000)
+                pos = idx
+            else:
+                while pos < idx:
+                    if not cap.grab(): return
+                    pos += 1
             ret, frame = cap.read()
-            if ret:
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frames.append(Image.fromarray(rgb_frame))
-                timestamps.append(idx / fps if fps > 0 else 0)
+            if pos is not None: pos += 1
+            if ret: yield _bgr_to_image(frame), float(t)
+    finally:
         cap.release()
-        return frames, timestamps
+
+def frames_at_times(source, timestamps):
+    pairs = list(iter_frames_at_times(source, timestamps))
+    return [f for f, _ in pairs], [t for _, t in pairs]
+
+def benchmark_samplers(video_url, num_frames):
+    """Times every strategy (plus what "auto" would choose) on the same source."""
+    source = local_source(video_url)
+    rows = []
+    for strategy in ["auto"] + SAMPLER_STRATEGIES:
+        started = tm.perf_counter()
+        try:
+            frames, _, used = sample_frames(source, num_frames, strategy)
+            rows.append({"strategy": strategy, "used": used, "seconds": round(tm.perf_counter() - started, 2), "frames": len(frames), "error": None})
+        except Exception as e:
+            rows.append({"strategy": strategy, "used": None, "seconds": round(tm.perf_counter() - started, 2), "frames": 0, "error": str(e)})
+    return rows
+
+# --- SMART SCAN (RANK MOMENTS BY MOTION, FLICKER & SCENE CUTS) ---
+SMART_SCAN_SIZE = (96, 54) # Tiny grayscale frames are plenty for "did something change?"
+SMART_SCAN_MAX_FPS = 4.0
+SMART_SCAN_MAX_FRAMES = 12000 # ~60MB of analysis frames, whatever the video length
+SMART_SCAN_WEIGHTS = {"motion": 1.0, "flicker": 1.0, "cut": 0.7}
+# Long sources are cut into segments decoded side by side (one ffmpeg process each)
+SCAN_WORKERS = os.cpu_count() or 2
+SCAN_SEGMENT_MIN_S = 120
+
+def _segment_signals(source, start, length, rate, threads=0):
+    """
+    Decodes one slice of the timeline (ffmpeg fps+scale to gray rawvideo) -> (times, {signal: array}).
+    motion = mean abs frame difference, flicker = change in mean brightness, cut = histogram distance.
+    Slices after the first start one analysis frame early so no difference is lost at the seams.
+    """
+    lead = 1 / rate if start > 0 else 0
+    w, h = SMART_SCAN_SIZE
+    raw = subprocess.run([
+        "ffmpeg", "-v", "error", "-threads", str(threads), "-ss", str(start - lead), "-t", str(length + lead), "-i", source, "-an",
+        "-vf", f"fps={rate},scale={w}:{h}", "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"
+    ], check=True, capture_output=True).stdout
+    n = len(raw) // (w * h)
+    if n < 2: return np.zeros(0), {name: np.zeros(0) for name in SMART_SCAN_WEIGHTS}
+    frames = np.frombuffer(raw, dtype=np.uint8, count=n * w * h).reshape(n, h, w)
+
+    pixels = frames.reshape(n, -1).astype(np.float32)
+    motion = np.abs(np.diff(pixels, axis=0)).mean(axis=1)
+    flicker = np.abs(np.diff(pixels.mean(axis=1)))
+    # 16-bin histograms for every frame in one bincount (offset each frame into its own bin range)
+    bins = (frames.reshape(n, -1) >> 4).astype(np.int64) + (np.arange(n, dtype=np.int64) * 16)[:, None]
+    hist = np.bincount(bins.ravel(), minlength=n * 16).reshape(n, 16) / (w * h)
+    cut = 0.5 * np.abs(np.diff(hist, axis=0)).sum(axis=1)
+    # Each signal describes the change INTO frame i+1, so it is stamped with that frame's time
+    times = (start - lead) + np.arange(1, n) / rate
+    return times, {"motion": motion, "flicker": flicker, "cut": cut}
+
+def iter_scan_segments(source):
+    """
+    Splits the timeline across SCAN_WORKERS and yields (done, total, times, signals) as each segment lands.
+    The decoding runs in separate ffmpeg processes; the pool threads just wait on them and do the
+    numpy scoring (which releases the GIL), so this scales with cores without pickling anything
+    out of the Streamlit script.
+    """
+    meta = video_meta(source)
+    if not meta or not meta['duration']: raise RuntimeError("Couldn't read this video's duration.")
+    duration = meta['duration']
+    rate = min(SMART_SCAN_MAX_FPS, SMART_SCAN_MAX_FRAMES / max(duration, 1))
+    count = int(max(1, min(SCAN_WORKERS * 2, duration // SCAN_SEGMENT_MIN_S)))
+    edges = np.linspace(0, duration, count + 1)
+    workers = min(SCAN_WORKERS, count)
+    # Share the cores out between the parallel decoders instead of each one grabbing all of them
+    threads = max(1, SCAN_WORKERS // workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        futures = [pool.submit(_segment_signals, source, float(a), float(b - a), rate, threads) for a, b in zip(edges[:-1], edges[1:])]
+        for done, future in enumerate(as_completed(futures), 1):
+            times, signals = future.result()
+            yield done, count, times, signals
+
+def _merge_segments(parts):
+    times = np.concatenate([t for t, _ in parts])
+    if not len(times): return np.zeros(0), {}
+    order = np.argsort(times)
+    return times[order], {name: np.concatenate([s[name] for _, s in parts])[order] for name in SMART_SCAN_WEIGHTS}
+
+def scan_signals(source, progress=None):
+    """
+    Whole-source signals, merged back into time order.
+    progress(done, total, moments) is called as each segment lands, with the best moments found so far.
+    """
+    parts = []
+    for done, total, times, signals in iter_scan_segments(source):
+        parts.append((times, signals))
+        if progress:
+            seen_times, seen_signals = _merge_segments(parts)
+            progress(done, total, rank_moments(seen_times, seen_signals, 5, 2.0))
+    return _merge_segments(parts)
+
+def rank_moments(times, signals, top_n, min_gap, weights=SMART_SCAN_WEIGHTS):
+    """
+    Robust z-score per signal (median/MAD, so a noisy or dark video doesn't drown the rest),
+    weighted sum, then greedy peak picking at least min_gap seconds apart.
+    Returns [(time, score, {signal: z})] best first.
+    """
+    if not len(times): return []
+    z = {}
+    for name, values in signals.items():
+        med = np.median(values)
+        mad = np.median(np.abs(values - med)) * 1.4826 + 1e-6
+        z[name] = np.clip((values - med) / mad, 0, None)
+    score = sum(weights[name] * z[name] for name in z)
+    picked = []
+    for i in np.argsort(score)[::-1]:
+        if len(picked) >= top_n: break
+        if all(abs(times[i] - times[j]) >= min_gap for j in picked): picked.append(i)
+    return [(float(times[i]), float(score[i]), {name: round(float(z[name][i]), 1) for name in z}) for i in picked]
+
+def smart_moments(source, top_n, progress=None):
+    """Top-N [(time, score, parts)] for a source, spread out so one long event can't take every slot."""
+    times, signals = scan_signals(source, progress)
+    if not len(times): return []
+    return rank_moments(times, signals, top_n, max(2.0, float(times[-1]) / (top_n * 3)))
+
+# --- AUDIO PEAK SCAN (BANGS, SCREAMS & EVPS WITHOUT DECODING VIDEO) ---
+AUDIO_SCAN_RATE = 8000 # Plenty for loudness/onsets, and 1/6 of the data of 48kHz
+AUDIO_SCAN_HOP = 0.05 # Envelope resolution in seconds
+AUDIO_SCAN_WEIGHTS = {"rms": 0.6, "peak": 0.8, "onset": 1.0}
+AUDIO_LEAD_IN = 1.0 # Start the clip just before the bang, not on it
+
+def audio_envelope(source):
+    """
+    Decodes ONLY the audio track (mono s16le at AUDIO_SCAN_RATE) in chunks and returns
+    (times, {"rms", "peak", "onset"}) per AUDIO_SCAN_HOP window. onset = rise in log energy.
+    """
+    hop = int(AUDIO_SCAN_RATE * AUDIO_SCAN_HOP)
+    proc = subprocess.Popen([
+        "ffmpeg", "-v", "error", "-i", source, "-vn", "-sn", "-ac", "1", "-ar", str(AUDIO_SCAN_RATE),
+        "-f", "s16le", "pipe:1"
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    rms, peak = [], []
+    chunk = hop * 2 * 1200 # ~1 minute of windows per read, so memory stays flat on long files
+    try:
+        while True:
+            data = proc.stdout.read(chunk)
+            usable = len(data) // (hop * 2) * hop * 2
+            if not usable: break
+            windows = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, hop).astype(np.float32) / 32768
+            rms.append(np.sqrt((windows ** 2).mean(axis=1)))
+            peak.append(np.abs(windows).max(axis=1))
+            if len(data) < chunk: break
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if not rms: raise RuntimeError("No audio track to scan.")
+    rms, peak = np.concatenate(rms), np.concatenate(peak)
+    log_energy = np.log10(rms + 1e-4)
+    onset = np.concatenate([[0.0], np.clip(np.diff(log_energy), 0, None)])
+    return np.arange(len(rms)) * AUDIO_SCAN_HOP, {"rms": rms, "peak": peak, "onset": onset}
+
+def audio_moments(source, top_n):
+    """Top-N loudest / most sudden audio events as [(clip start, score, parts)], with a short lead-in."""
+    times, signals = audio_envelope(source)
+    moments = rank_moments(times, signals, top_n, max(2.0, float(times[-1]) / (top_n * 3)), weights=AUDIO_SCAN_WEIGHTS)
+    return [(max(0.0, t - AUDIO_LEAD_IN), s, parts) for t, s, parts in moments]
+
+SCORE_ICONS = {"motion": "🏃", "flicker": "💡", "cut": "✂️", "rms": "🔊", "peak": "💥", "onset": "⚡"}
+
+def scan_score_caption(i):
+    """Score line under grid frame i (only after a Smart or Audio scan)."""
+    scores = st.session_state.get("db_scores") or []
+    if i < len(scores) and scores[i] and scores[i][1]:
+        s, parts = scores[i]
+        st.caption(f"👻 {s:.1f} • " + " • ".join(f"{SCORE_ICONS.get(k, k)} {v}" for k, v in parts.items()))
+
+# --- SCAN FRAME STORE (SMALL JPEG THUMBS, NOT FULL FRAMES, IN SESSION STATE) ---
+SCAN_THUMB_WIDTH = 360 # The grid is 5 columns wide, so this is already generous
+SCAN_THUMB_QUALITY = 80
+SCAN_THUMB_MAX_BYTES = 64 * 1024 * 1024 # Shared by every session; least recently shown goes first
+
+@st.cache_resource
+def get_thumb_store():
+    """Process-wide LRU of encoded grid thumbnails, keyed by source + timestamp."""
+    return {"lock": threading.Lock(), "items": OrderedDict(), "bytes": 0}
+
+def scan_frame_key(video_url, ts):
+    return f"{source_cache_key(direct_dropbox_url(video_url))}@{round(float(ts), 3)}"
+
+def _put_thumb(key, image):
+    img = image.convert("RGB")
+    img.thumbnail((SCAN_THUMB_WIDTH, SCAN_THUMB_WIDTH * 2))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=SCAN_THUMB_QUALITY)
+    data = buf.getvalue()
+    store = get_thumb_store()
+    with store['lock']:
+        old = store['items'].pop(key, None)
+        if old: store['bytes'] -= len(old)
+        store['items'][key] = data
+        store['bytes'] += len(data)
+        while store['bytes'] > SCAN_THUMB_MAX_BYTES and len(store['items']) > 1:
+            _, dropped = store['items'].popitem(last=False)
+            store['bytes'] -= len(dropped)
+    return data
+
+def compact_scan_frame(video_url, ts, image):
+    """Thumbnails one decoded frame into the shared store. The session keeps only {'ts', 'key'}."""
+    key = scan_frame_key(video_url, ts)
+    _put_thumb(key, image)
+    return {"ts": float(ts), "key": key}
+
+def full_frame(video_url, ts):
+    """Full-resolution frame, decoded on demand (CROP). None if the source can't be read."""
+    frames, _ = frames_at_times(local_source(direct_dropbox_url(video_url)), [ts])
+    return frames[0] if frames else None
+
+def scan_thumb(entry, video_url):
+    """JPEG bytes for a grid entry. Evicted thumbs are re-decoded from the (cached) source."""
+    store = get_thumb_store()
+    with store['lock']:
+        data = store['items'].get(entry['key'])
+        if data: store['items'].move_to_end(entry['key'])
+    if data: return data
+    image = full_frame(video_url, entry['ts'])
+    return _put_thumb(entry['key'], image) if image else None
+
+# --- PERCEPTUAL HASHING (NEAR-DUPLICATE FRAMES & CROPS) ---
+HASH_TABLE = "image_hashes" # file_url, filename, ahash, dhash, phash (16-char hex each)
+GRID_DUPE_DISTANCE = 6 # dHash bits: same static shot give or take sensor noise
+LIBRARY_DUPE_DISTANCE = 8 # pHash bits: survives re-crops, resizes and JPEG re-saves
+
+def _gray(image, w, h):
+    return np.asarray(image.convert("L").resize((w, h), Image.LANCZOS), dtype=np.float32)
+
+def _bits_to_hex(bits):
+    return f"{int(''.join('1' if b else '0' for b in bits.ravel()), 2):016x}"
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] /= np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+DCT_32 = _dct_matrix(32)
+
+def image_hashes(image):
+    """64-bit aHash / dHash / pHash of a PIL image, as hex strings."""
+    a = _gray(image, 8, 8)
+    d = _gray(image, 9, 8)
+    # pHash: 2D DCT of a 32x32 thumbnail, low 8x8 frequencies vs their median (DC term excluded)
+    low = (DCT_32 @ _gray(image, 32, 32) @ DCT_32.T)[:8, :8].ravel()
+    return {
+        "ahash": _bits_to_hex(a > a.mean()),
+        "dhash": _bits_to_hex(d[:, 1:] > d[:, :-1]),
+        "phash": _bits_to_hex(low > np.median(low[1:]))
+    }
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+def _popcount64(values):
+    """Bit count of every uint64 in an array (vectorized, no per-row Python)."""
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+@st.cache_resource
+def get_hash_index():
+    """In-memory mirror of HASH_TABLE: pHash/dHash as uint64 arrays so a lookup is one XOR + popcount."""
+    return {"lock": threading.Lock(), "loaded": False, "urls": [], "names": [],
+            "phash": np.zeros(0, dtype=np.uint64), "dhash": np.zeros(0, dtype=np.uint64)}
+
+def _load_hash_index(index):
+    rows, page = [], 0
+    while True:
+        batch = supabase.table(HASH_TABLE).select("file_url, filename, phash, dhash").range(page * 1000, page * 1000 + 999).execute().data
+        rows += batch
+        if len(batch) < 1000: break
+        page += 1
+    index['urls'] = [r['file_url'] for r in rows]
+    index['names'] = [r.get('filename') for r in rows]
+    index['phash'] = np.array([int(r['phash'], 16) for r in rows], dtype=np.uint64)
+    index['dhash'] = np.array([int(r['dhash'], 16) for r in rows], dtype=np.uint64)
+    index['loaded'] = True
+
+def find_similar_images(hashes, max_distance=LIBRARY_DUPE_DISTANCE, limit=3):
+    """Library images whose pHash is within max_distance bits: [(distance, file_url, filename)] closest first."""
+    index = get_hash_index()
+    with index['lock']:
+        if not index['loaded']: _load_hash_index(index)
+        if not len(index['phash']): return []
+        dist = _popcount64(index['phash'] ^ np.uint64(int(hashes['phash'], 16)))
+        hits = np.flatnonzero(dist <= max_distance)
+        hits = hits[np.argsort(dist[hits])][:limit]
+        return [(int(dist[i]), index['urls'][i], index['names'][i]) for i in hits]
+
+def register_image_hash(file_url, filename, hashes):
+    """Persists a library image's hashes and adds them to the live index."""
+    supabase.table(HASH_TABLE).insert({"file_url": file_url, "filename": filename, **hashes}).execute()
+    index = get_hash_index()
+    with index['lock']:
+        if not index['loaded']: return # Picked up on first load
+        index['urls'].append(file_url); index['names'].append(filename)
+        index['phash'] = np.append(index['phash'], np.uint64(int(hashes['phash'], 16)))
+        index['dhash'] = np.append(index['dhash'], np.uint64(int(hashes['dhash'], 16)))
+
+def forget_image_hash(file_url):
+    try: supabase.table(HASH_TABLE).delete().eq("file_url", file_url).execute()
+    except Exception: pass
+    index = get_hash_index()
+    with index['lock']:
+        keep = [i for i, u in enumerate(index['urls']) if u != file_url]
+        index['urls'] = [index['urls'][i] for i in keep]
+        index['names'] = [index['names'][i] for i in keep]
+        index['phash'], index['dhash'] = index['phash'][keep], index['dhash'][keep]
+
+def backfill_image_hashes(progress=None):
+    """Hashes every library image that isn't in HASH_TABLE yet. Returns (added, failed)."""
+    index = get_hash_index()
+    with index['lock']:
+        if not index['loaded']: _load_hash_index(index)
+        known = set(index['urls'])
+    todo = [r for r in supabase.table("uploaded_images").select("file_url, filename").eq("media_type", "image").execute().data if r['file_url'] not in known]
+    added = failed = 0
+    for i, row in enumerate(todo, 1):
+        try:
+            resp = requests.get(row['file_url'], timeout=30)
+            resp.raise_for_status()
+            register_image_hash(row['file_url'], row['filename'], image_hashes(Image.open(io.BytesIO(resp.content))))
+            added += 1
+        except Exception: failed += 1
+        if progress: progress(i, len(todo))
+    return added, failed
+
+def check_library_duplicate(image):
+    """Hashes a crop about to be saved. Returns (hashes, matches) - matches empty when it looks new."""
+    hashes = image_hashes(image)
+    try: matches = find_similar_images(hashes)
+    except Exception: matches = [] # Index unavailable (e.g. table missing) - never block a save on it
+    return hashes, matches
+
+# --- SCAN JOBS (BACKGROUND SCANS, THE GRID FILLS IN AS FRAMES DECODE) ---
+SCAN_JOB_TTL = 60 * 60
+
+@st.cache_resource
+def get_scan_jobs():
+    return {"jobs": {}, "lock": threading.Lock()}
+
+def _run_scan_job(job):
+    """Thread body. Never calls st.* - each decoded frame is thumbnailed and appended to job['frames']."""
+    try:
+        scores = {}
+        if job['mode'] in ("smart", "audio"):
+            source = local_source(direct_dropbox_url(job['url']))
+            def on_segment(done, total, best):
+                job['stage'] = f"🧩 Scoring segments {done}/{total} • best so far: " + (", ".join(f"{t:.0f}s" for t, _, _ in best) or "-")
+            if job['mode'] == "audio":
+                job['stage'] = "🔊 Listening for peaks"
+                moments = audio_moments(source, job['total'])
+            else: moments = smart_moments(source, job['total'], on_segment)
+            scores = {round(t, 3): (s, parts) for t, s, parts in moments}
+            job['stage'] = "🖼️ Decoding top moments"
+            pairs = iter_frames_at_times(source, [t for t, _, _ in moments])
+        else:
+            job['stage'] = "🖼️ Decoding frames"
+            pairs = extract_frames_from_url(job['url'], job['total'])
+        kept = []
+        for image, ts in pairs:
+            if job['cancel']: pairs.close(); break
+            if job['dedupe']:
+                dh = image_hashes(image)['dhash']
+                if any(hamming(dh, k) <= GRID_DUPE_DISTANCE for k in kept):
+                    job['skipped'] += 1; continue
+                kept.append(dh)
+            entry = compact_scan_frame(job['url'], ts, image)
+            if scores: entry['score'] = scores.get(round(ts, 3))
+            job['frames'].append(entry)
+        job['status'] = "cancelled" if job['cancel'] else "done"
     except Exception as e:
-        st.error(f"Scan Error: {e}")
-        return [], 0
+        job['status'], job['error'] = "failed", str(e)
+    job['finished'] = tm.time()
+
+def submit_scan_job(video_url, num_frames, mode="even", dedupe=False):
+    """
+    Starts a scan in the background and returns its id. The grid reads job['frames'] as it grows.
+    mode: "even" (evenly spaced), "smart" (motion/flicker/cuts) or "audio" (loudness peaks, no video decode).
+    """
+    registry = get_scan_jobs()
+    cutoff = tm.time() - SCAN_JOB_TTL
+    with registry['lock']:
+        for jid in [jid for jid, j in registry['jobs'].items() if j['finished'] and j['finished'] < cutoff]:
+            del registry['jobs'][jid]
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id, "url": video_url, "total": num_frames, "mode": mode, "frames": [],
+            "dedupe": dedupe and mode == "even", "skipped": 0,
+            "status": "running", "stage": "📥 Opening source", "error": None, "cancel": False,
+            "submitted": tm.time(), "finished": None
+        }
+        registry['jobs'][job_id] = job
+    threading.Thread(target=_run_scan_job, args=(job,), daemon=True, name=f"scan-{job_id}").start()
+    return job_id
+
+def get_scan_job(job_id):
+    return get_scan_jobs()['jobs'].get(job_id)
+
+def discard_scan():
+    """Empties the grid and stops a scan that is still filling it."""
+    job = get_scan_job(st.session_state.pop("scan_job", ""))
+    if job: job['cancel'] = True
+    st.session_state.db_frames = []
+
+def sync_scan_job():
+    """Copies whatever the background scan has decoded so far into the grid. Returns the job while it runs."""
+    job_id = st.session_state.get("scan_job")
+    job = get_scan_job(job_id) if job_id else None
+    if job is None:
+        st.session_state.pop("scan_job", None); return None
+    entries = list(job['frames'])
+    st.session_state.db_frames = entries
+    st.session_state.db_timestamps = [e['ts'] for e in entries]
+    st.session_state.db_scores = [e.get('score') for e in entries]
+    st.session_state.scan_skipped = job['skipped']
+    if job['status'] == "running": return job
+    st.session_state.scan_seconds = round(job['finished'] - job['submitted'], 1)
+    if job['status'] == "failed": st.error(f"Scan Error: {job['error']}")
+    del st.session_state.scan_job
+    return None
+
+@st.fragment(run_every=1.0)
+def scan_job_banner(job_id):
+    """Polls the scan once a second on its own; reruns the page only when new frames have landed."""
+    job = get_scan_job(job_id)
+    if job is None: return
+    if job['status'] != "running" or len(job['frames']) != len(st.session_state.get("db_frames", [])):
+        st.rerun()
+    c_msg, c_btn = st.columns([3, 1])
+    with c_msg:
+        got = len(job['frames']) + job['skipped']
+        hidden = f" ({job['skipped']} near-duplicates hidden)" if job['skipped'] else ""
+        st.progress(min(1.0, got / max(job['total'], 1)), text=f"{job['stage']} • {got}/{job['total']} frames{hidden} • {int(tm.time() - job['submitted'])}s")
+    with c_btn:
+        if st.button("🛑 STOP SCAN", key="scan_stop", use_container_width=True):
+            job['cancel'] = True
+
+# --- TRICKPLAY SPRITES (SCRUB THE TIMELINE WITHOUT STREAMING THE VIDEO) ---
+SPRITE_DIR = os.path.join(CACHE_ROOT, "sprites")
+SPRITE_TILE_WIDTH = 160
+SPRITE_GRID = (10, 10) # cols x rows -> 100 thumbnails per JPEG sheet
+SPRITE_MAX_TILES = 600 # Long sources get a wider interval instead of more sheets
+SPRITE_MIN_INTERVAL = 2
+
+def sprite_index(video_url):
+    """
+    One-time sprite sheets for a source: a thumbnail every N seconds, tiled into a few JPEGs,
+    plus index.json (interval, tile size, sheet files). Built next to the source cache and reused.
+    """
+    video_url = direct_dropbox_url(video_url)
+    source = local_source(video_url)
+    meta = video_meta(video_url)
+    if not meta or not meta['duration']: raise RuntimeError("Couldn't read this video's duration.")
+    duration = meta['duration']
+    # Content hash of the cached copy, so another share link to the same file reuses the sheets
+    folder = os.path.join(SPRITE_DIR, source_identity(video_url))
+    index_path = os.path.join(folder, "index.json")
+    try:
+        with open(index_path) as f: return {**json.load(f), "folder": folder}
+    except (OSError, ValueError): pass
+
+    interval = max(SPRITE_MIN_INTERVAL, int(np.ceil(duration / SPRITE_MAX_TILES)))
+    cols, rows = SPRITE_GRID
+    os.makedirs(folder, exist_ok=True)
+    run_ffmpeg([
+        "ffmpeg", "-y", "-i", source, "-an", "-sn",
+        "-vf", f"fps=1/{interval},scale={SPRITE_TILE_WIDTH}:-2,tile={cols}x{rows}",
+        "-q:v", "5", os.path.join(folder, "sheet_%03d.jpg")
+    ])
+    sheets = sorted(f for f in os.listdir(folder) if f.startswith("sheet_"))
+    if not sheets: raise RuntimeError("No frames could be decoded for the timeline.")
+    with Image.open(os.path.join(folder, sheets[0])) as first:
+        tile_w, tile_h = first.width // cols, first.height // rows
+    index = {
+        "interval": interval, "tile_w": tile_w, "tile_h": tile_h, "cols": cols, "rows": rows, "sheets": sheets,
+        "count": min(int(np.ceil(duration / interval)), len(sheets) * cols * rows), "duration": duration
+    }
+    with open(index_path, "w") as f: json.dump(index, f)
+    return {**index, "folder": folder}
+
+def sprite_tile(index, ts):
+    """The thumbnail nearest to ts, cut out of its sheet."""
+    folder = index['folder']
+    i = min(int(round(ts / index['interval'])), index['count'] - 1)
+    per_sheet = index['cols'] * index['rows']
+    sheet, slot = divmod(i, per_sheet)
+    row, col = divmod(slot, index['cols'])
+    with Image.open(os.path.join(folder, index['sheets'][sheet])) as img:
+        return img.crop((col * index['tile_w'], row * index['tile_h'], (col + 1) * index['tile_w'], (row + 1) * index['tile_h']))
 
 # --- MAIN TITLE ---
 # 🛡️ SAFETY WRAPPER: Prevents app crash if Supabase connection flickers
@@ -1102,28 +3031,37 @@ with tab_upload:
                 key="uni_cropper"
             )
             
+            allow_dupe_uni = st.checkbox("Save even if it matches a library image", key="dupe_uni")
             if st.button("✅ SAVE CROP TO DROPBOX", type="primary"):
                 try:
-                    with st.spinner("Saving to /Social System..."):
-                        buf = io.BytesIO()
-                        cropped.convert("RGB").resize((1080, 1080)).save(buf, format="JPEG", quality=90)
-                        final_name = f"crop_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+                    final_img = cropped.convert("RGB").resize((1080, 1080))
+                    hashes, matches = check_library_duplicate(final_img)
+                    if matches and not allow_dupe_uni:
+                        st.warning("⚠️ Looks like an image already in the library - not saved:")
+                        for dist, m_url, m_name in matches: st.image(m_url, caption=f"{m_name} ({dist} bits apart)", width=150)
+                    else:
+                        with st.spinner("Saving to /Social System..."):
+                            buf = io.BytesIO()
+                            final_img.save(buf, format="JPEG", quality=90)
+                            final_name = f"crop_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
                         
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                            tmp.write(buf.getvalue()); tmp_path = tmp.name
+                            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
+                                tmp.write(buf.getvalue()); tmp_path = tmp.name
                         
-                        url = upload_to_social_system(tmp_path, final_name)
-                        os.remove(tmp_path)
+                            url = upload_to_social_system(tmp_path, final_name)
+                            os.remove(tmp_path)
                         
-                        if url:
-                            supabase.table("uploaded_images").insert({
-                                "file_url": url, 
-                                "filename": final_name, 
-                                "media_type": "image"
-                            }).execute()
-                            st.success("✅ Saved to Dropbox!")
-                            st.session_state.crop_source_img = None; st.rerun()
-                        else: st.error("Upload failed.")
+                            if url:
+                                supabase.table("uploaded_images").insert({
+                                    "file_url": url, 
+                                    "filename": final_name, 
+                                    "media_type": "image"
+                                }).execute()
+                                try: register_image_hash(url, final_name, hashes)
+                                except Exception: pass # Backfill picks it up later
+                                st.success("✅ Saved to Dropbox!")
+                                st.session_state.crop_source_img = None; st.rerun()
+                            else: st.error("Upload failed.")
                 except Exception as e: st.error(f"Error: {e}")
 
     # --- COLUMN 2: LIBRARY (PAGINATED) ---
@@ -1274,7 +3212,8 @@ with tab_upload:
                                     st.error(f"Critical Error: {e}")
                         
                         if st.button("🗑️", key=f"d_{img['id']}"): 
-                            supabase.table("uploaded_images").delete().eq("id", img['id']).execute(); st.rerun()
+                            supabase.table("uploaded_images").delete().eq("id", img['id']).execute()
+                            forget_image_hash(img['file_url']); st.rerun()
 # --- TAB 3: DROPBOX LAB ---
 with tab_dropbox:
     st.subheader("🎥 Source Material Processor")
@@ -1286,19 +3225,33 @@ with tab_dropbox:
     # A. GRID SCANNER
     if tool_mode.startswith("🔍"):
         mode = st.radio("Output Type:", ["📸 Photo (Crop)", "🎬 Reel (Video)"], horizontal=True)
-        snap_count = st.slider("Snapshot Density", 10, 50, 20)
+        c_snap, c_scan = st.columns(2)
+        with c_snap: snap_count = st.slider("Snapshot Density", 10, 50, 20)
+        with c_scan:
+            scan_mode = st.radio("Scan Mode:", ["📏 Evenly Spaced", "👻 Smart (Motion / Flicker / Cuts)", "🔊 Audio Peaks (Bangs / Screams)"], horizontal=True)
+            # Ranked moments on a static shot look alike by design - only the evenly spaced grid is collapsed
+            scan_dedupe = st.checkbox("🧹 Hide near-duplicate frames", value=True, disabled=not scan_mode.startswith("📏"), help="Evenly Spaced only: static CCTV shots otherwise fill the grid with the same picture.")
         
         if "db_frames" not in st.session_state: st.session_state.db_frames = []
         if "db_timestamps" not in st.session_state: st.session_state.db_timestamps = []
 
         if st.button("🚀 SCAN SOURCE", type="primary"):
             if db_url:
-                with st.spinner("Scanning..."):
-                    frames, timestamps = extract_frames_from_url(db_url, snap_count)
-                    st.session_state.db_frames = frames
-                    st.session_state.db_timestamps = timestamps
-                    if "preview_reel_path" in st.session_state: del st.session_state.preview_reel_path
+                # Runs in the background: frames show up in the grid below as they decode
+                old_job = get_scan_job(st.session_state.get("scan_job", ""))
+                if old_job: old_job['cancel'] = True
+                scan_kind = {"👻": "smart", "🔊": "audio"}.get(scan_mode[0], "even")
+                st.session_state.scan_job = submit_scan_job(db_url, snap_count, mode=scan_kind, dedupe=scan_dedupe)
+                st.session_state.db_source = db_url
+                st.session_state.scan_seconds = None
+                clear_preview()
+                for k in [k for k in st.session_state if str(k).startswith("bsel_")]: del st.session_state[k]
             else: st.warning("Need link.")
+        active_scan = sync_scan_job()
+        if active_scan: scan_job_banner(active_scan['id'])
+        elif st.session_state.db_frames and st.session_state.get("scan_seconds") is not None:
+            hidden = st.session_state.get("scan_skipped", 0)
+            st.caption(f"⏱️ Last scan: {len(st.session_state.db_frames)} frames in {st.session_state.scan_seconds}s" + (f" • 🧹 {hidden} near-duplicates hidden" if hidden else ""))
 
         # Photo Mode
         if mode.startswith("📸") and st.session_state.db_frames:
@@ -1307,26 +3260,35 @@ with tab_dropbox:
                 c1, c2 = st.columns([2, 1])
                 with c1: cropped = st_cropper(st.session_state.frame_to_crop, aspect_ratio=(1,1), box_color='#00ff41', key="ph_crop")
                 with c2:
+                    allow_dupe_ph = st.checkbox("Save even if it matches a library image", key="dupe_ph")
                     if st.button("💾 SAVE TO IMG VAULT", type="primary"):
                         try:
-                            with st.spinner("Saving to Dropbox..."):
-                                buf = io.BytesIO()
-                                cropped.convert("RGB").resize((1080, 1080)).save(buf, format="JPEG", quality=90)
-                                fname = f"crop_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
+                            final_img = cropped.convert("RGB").resize((1080, 1080))
+                            hashes, matches = check_library_duplicate(final_img)
+                            if matches and not allow_dupe_ph:
+                                st.warning("⚠️ Looks like an image already in the library - not saved:")
+                                for dist, m_url, m_name in matches: st.image(m_url, caption=f"{m_name} ({dist} bits apart)", width=150)
+                            else:
+                                with st.spinner("Saving to Dropbox..."):
+                                    buf = io.BytesIO()
+                                    final_img.save(buf, format="JPEG", quality=90)
+                                    fname = f"crop_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
                                 
-                                with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                                    tmp.write(buf.getvalue()); tmp_path = tmp.name
+                                    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
+                                        tmp.write(buf.getvalue()); tmp_path = tmp.name
                                 
-                                url = upload_to_social_system(tmp_path, fname)
-                                os.remove(tmp_path)
-
-                                if url:
-                                    supabase.table("uploaded_images").insert({
-                                        "file_url": url, "filename": fname, "media_type": "image"
-                                    }).execute()
-                                    st.success("✅ Saved to Dropbox!")
-                                    st.session_state.frame_to_crop = None; st.rerun()
-                                else: st.error("Dropbox Upload Failed")
+                                    url = upload_to_social_system(tmp_path, fname)
+                                    os.remove(tmp_path)
+
+                                    if url:
+                                        supabase.table("uploaded_images").insert({
+                                            "file_url": url, "filename": fname, "media_type": "image"
+                                        }).execute()
+                                        try: register_image_hash(url, fname, hashes)
+                                        except Exception: pass # Backfill picks it up later
+                                        st.success("✅ Saved to Dropbox!")
+                                        st.session_state.frame_to_crop = None; st.rerun()
+                                    else: st.error("Dropbox Upload Failed")
                         except Exception as e: st.error(f"Save Error: {e}")
                     if st.button("❌ CANCEL CROP"): st.session_state.frame_to_crop = None; st.rerun()
             else:
@@ -1335,13 +3297,18 @@ with tab_dropbox:
                 with c_head: st.write("📸 **Select a frame to crop:**")
                 with c_clear:
                     if st.button("🗑️ DISCARD SCAN", key="clr_ph"):
-                        st.session_state.db_frames = []; st.rerun()
+                        discard_scan(); st.rerun()
                 
                 cols = st.columns(5)
-                for i, frame in enumerate(st.session_state.db_frames):
+                for i, entry in enumerate(st.session_state.db_frames):
                     with cols[i % 5]:
-                        st.image(frame, use_container_width=True)
-                        if st.button("✂️ CROP", key=f"cr_{i}"): st.session_state.frame_to_crop = frame; st.rerun()
+                        st.image(scan_thumb(entry, st.session_state.db_source), use_container_width=True)
+                        scan_score_caption(i)
+                        if st.button("✂️ CROP", key=f"cr_{i}"):
+                            # Only the frame being cropped is ever held at full resolution
+                            with st.spinner("Loading full frame..."):
+                                st.session_state.frame_to_crop = full_frame(st.session_state.db_source, entry['ts'])
+                            st.rerun()
 
         # Reel Mode
         elif mode.startswith("🎬") and st.session_state.db_frames:
@@ -1351,78 +3318,102 @@ with tab_dropbox:
             c_eff, c_dur = st.columns(2)
             with c_eff: effect_choice = st.selectbox("Effect:", EFFECTS_LIST)
             with c_dur: clip_dur = st.slider("Duration (s)", 5, 60, 15)
+            # Chosen up-front so the Landscape comes out of the same ffmpeg pass as the preview
+            c_full, c_proxy = st.columns(2)
+            with c_full: save_full = st.checkbox("➕ Also Save Uncropped (Landscape)?", value=True)
+            with c_proxy: proxy_preview = st.checkbox("⚡ Fast 360p Previews", value=True, help="Full quality is rendered only when you APPROVE.")
+            final_profile = st.selectbox("🎛️ Final Encode Profile", ["short-final", "archive"], help="Used for the full-quality Short (APPROVE and batch). Landscape always uses landscape-final.")
 
             # --- MONITOR SECTION ---
+            active_job = sync_preview_job()
+            if active_job: render_job_banner(active_job['id'], "grid")
             if "preview_reel_path" in st.session_state and os.path.exists(st.session_state.preview_reel_path):
                 st.markdown("### 🎬 MONITOR")
                 # LAYOUT UPDATE: Video takes 1/3, Controls take 2/3 (Makes video smaller)
                 c_vid, c_act = st.columns([1, 2])
                 with c_vid: 
                     st.video(st.session_state.preview_reel_path)
+                    for s in st.session_state.get("preview_stats", []): st.caption(f"📊 {encode_stats_line(s)}")
                 
                 with c_act:
-                    save_full = st.checkbox("➕ Also Save Uncropped (Landscape)?", value=True)
-                    
                     if st.button("✅ APPROVE & VAULT", type="primary"):
                         with st.status("🚀 Processing Assets...", expanded=True) as status:
-                            # 1. Save Short
-                            status.write("📱 Processing Short...")
-                            fn_short = f"reel_short_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
-                            url_short = upload_to_social_system(st.session_state.preview_reel_path, fn_short)
-                            
-                            if url_short:
-                                supabase.table("uploaded_images").insert({
-                                    "file_url": url_short, "filename": fn_short, "media_type": "video"
-                                }).execute()
-                                status.write("✅ Short Vaulted!")
+                            # 0. An upload that failed last time resumes with the same files and names
+                            render_ok = True
+                            if st.session_state.get("pending_vault"):
+                                status.write("🔁 Resuming unfinished upload...")
+                            else:
+                                # Full-quality files (proxy previews get their one real render here)
+                                short_path, temp_full = finalize_preview(st.session_state.get("last_render_params"), save_full, status)
+                                render_ok = short_path is not None
 
-                            # 2. Save Full
-                            if save_full and "last_render_params" in st.session_state:
-                                status.write("🎞️ Rendering Landscape Version...")
-                                p = st.session_state.last_render_params
+                                # 1. Landscape (already rendered in the same pass as the Short when ticked up-front)
+                                fn_short = f"reel_short_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
                                 fn_full = f"reel_full_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
-                                temp_full = "temp_full_render.mp4"
-                                success = process_reel(p['url'], p['ts'], p['dur'], p['fx'], temp_full, crop=False)
-                                if success:
-                                    status.write("☁️ Uploading Landscape...")
-                                    url_full = upload_to_social_system(temp_full, fn_full)
-                                    if url_full:
-                                        supabase.table("uploaded_images").insert({
-                                            "file_url": url_full, "filename": fn_full, "media_type": "video"
-                                        }).execute()
-                                        status.write("✅ Full Clip Vaulted!")
-                                    os.remove(temp_full)
-
-                            # Cleanup
-                            if os.path.exists(st.session_state.preview_reel_path):
-                                os.remove(st.session_state.preview_reel_path)
-                            del st.session_state.preview_reel_path
-                            status.update(label="🎉 Process Complete!", state="complete", expanded=False)
-                            import time; time.sleep(1); st.rerun()
+                                if save_full and temp_full and os.path.exists(temp_full):
+                                    status.write("🎞️ Landscape rendered alongside the Short...")
+                                    success = True
+                                elif save_full and short_path and "last_render_params" in st.session_state:
+                                    status.write("🎞️ Rendering Landscape Version...")
+                                    p = st.session_state.last_render_params
+                                    temp_full = os.path.join(RENDER_DIR, f"full_{uuid.uuid4().hex[:12]}.mp4")
+                                    success = process_reel(p['url'], p['ts'], p['dur'], p['fx'], temp_full, crop=False, timeout=None)
+                                else: success = False
+                                st.session_state.pending_vault = ([{"path": short_path, "name": fn_short, "done": "✅ Short Vaulted!"}] if short_path else []) + \
+                                    ([{"path": temp_full, "name": fn_full, "done": "✅ Full Clip Vaulted!"}] if success else [])
+
+                            # 2. Upload Short + Landscape side by side, committed together
+                            if not render_ok:
+                                # Nothing to vault: keep the preview and the failure on screen
+                                status.update(label="❌ Full-quality render failed - preview kept, APPROVE to retry", state="error", expanded=True)
+                            elif vault_pending_assets(status):
+                                clear_preview()
+                                status.update(label="🎉 Process Complete!", state="complete", expanded=False)
+                                import time; time.sleep(1); st.rerun()
+                            else:
+                                status.update(label="⚠️ Upload incomplete - APPROVE again to resume", state="error", expanded=True)
                     
                     if st.button("❌ DISCARD PREVIEW"):
-                        os.remove(st.session_state.preview_reel_path); del st.session_state.preview_reel_path; st.rerun()
+                        clear_preview(); st.rerun()
             st.divider()
 
+            # --- BATCH SECTION ---
+            if st.session_state.get("render_batch"): render_batch_banner(st.session_state.render_batch)
+            picked = [i for i in range(len(st.session_state.db_frames)) if st.session_state.get(f"bsel_{i}")]
+            c_all, c_none, c_go = st.columns([1, 1, 2])
+            with c_all:
+                if st.button("☑️ SELECT ALL", key="bsel_all"):
+                    for i in range(len(st.session_state.db_frames)): st.session_state[f"bsel_{i}"] = True
+                    st.rerun()
+            with c_none:
+                if st.button("⬜ CLEAR", key="bsel_none"):
+                    for i in range(len(st.session_state.db_frames)): st.session_state[f"bsel_{i}"] = False
+                    st.rerun()
+            with c_go:
+                if st.button(f"📦 BATCH RENDER & VAULT ({len(picked)})", type="primary", disabled=not picked or bool(st.session_state.get("render_batch"))):
+                    picked_ts = [st.session_state.db_timestamps[i] for i in picked]
+                    st.session_state.render_batch = submit_render_batch(st.session_state.db_source, picked_ts, clip_dur, effect_choice, landscape=save_full, profile=final_profile)
+                    for i in picked: st.session_state[f"bsel_{i}"] = False
+                    st.rerun()
+
             # --- GRID SECTION ---
             c_head, c_clear = st.columns([3, 1])
-            with c_head: st.write("🎬 **Click '▶️ PREVIEW' to render a test clip:**")
+            with c_head: st.write("🎬 **Click '▶️ PREVIEW' to render a test clip, or tick moments for a batch:**")
             with c_clear:
                 if st.button("🗑️ DISCARD SCAN", key="clr_rl"):
-                    st.session_state.db_frames = []; st.rerun()
+                    discard_scan(); st.rerun()
 
             cols = st.columns(5)
-            for i, frame in enumerate(st.session_state.db_frames):
+            for i, entry in enumerate(st.session_state.db_frames):
                 with cols[i % 5]:
-                    st.image(frame, use_container_width=True)
+                    st.image(scan_thumb(entry, st.session_state.db_source), use_container_width=True)
+                    scan_score_caption(i)
                     ts = st.session_state.db_timestamps[i]
+                    st.checkbox(f"Batch @ {ts:.1f}s", key=f"bsel_{i}")
                     if st.button(f"▶️ PREVIEW", key=f"prev_{i}"):
-                        temp_name = "temp_preview_reel.mp4"
-                        with st.spinner("Rendering..."):
-                            st.session_state.last_render_params = {'url': db_url, 'ts': ts, 'dur': clip_dur, 'fx': effect_choice}
-                            if process_reel(db_url, ts, clip_dur, effect_choice, temp_name, crop=True): 
-                                st.session_state.preview_reel_path = temp_name
-                                st.rerun()
+                        st.session_state.last_render_params = {'url': st.session_state.db_source, 'ts': ts, 'dur': clip_dur, 'fx': effect_choice, 'profile': final_profile}
+                        st.session_state.preview_job = submit_render_job(st.session_state.db_source, ts, clip_dur, effect_choice, crop=True, landscape=save_full, proxy=proxy_preview, profile=None if proxy_preview else final_profile)
+                        st.rerun()
 
     # B. PRECISION CUTTER (UPDATED)
     elif tool_mode.startswith("⏱️"):
@@ -1434,111 +3425,148 @@ with tab_dropbox:
         if st.button("📡 LOAD VIDEO INFO"):
             if db_url:
                 st.session_state.vid_duration = get_video_duration(db_url)
-                st.session_state.display_url = db_url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
+                st.session_state.display_url = direct_dropbox_url(db_url)
+                # One-time trickplay sheets: scrubbing then loads a few small JPEGs, not the whole video
+                try:
+                    with st.spinner("Building timeline thumbnails (first time only)..."):
+                        st.session_state.sprite_idx = sprite_index(db_url)
+                except Exception as e:
+                    st.session_state.sprite_idx = None
+                    st.warning(f"Timeline thumbnails unavailable ({e}) - use the player instead.")
                 st.rerun()
         
         if st.session_state.display_url:
-            st.video(st.session_state.display_url)
+            sprites = st.session_state.get("sprite_idx")
+            if st.checkbox("▶️ Stream Full Video", value=not sprites, key="show_player"):
+                st.video(st.session_state.display_url)
             
             st.divider()
             st.subheader("✂️ Cut Settings")
-            
-            c_s1, c_s2 = st.columns(2)
-            with c_s1: s_min = st.number_input("Start Minute", min_value=0, value=0, step=1, key="s_min")
-            with c_s2: s_sec = st.number_input("Start Second", min_value=0, max_value=59, value=0, step=1, key="s_sec")
-            
-            c_e1, c_e2 = st.columns(2)
-            with c_e1: e_min = st.number_input("End Minute", min_value=0, value=0, step=1, key="e_min")
-            with c_e2: e_sec = st.number_input("End Second", min_value=0, max_value=59, value=0, step=1, key="e_sec")
 
-            start_ts = (s_min * 60) + s_sec
-            end_ts = (e_min * 60) + e_sec
+            pick_mode = "⌨️ Type Times"
+            if sprites: pick_mode = st.radio("Pick times with:", ["🎞️ Timeline", "⌨️ Type Times"], horizontal=True, key="pick_mode")
+
+            if pick_mode.startswith("🎞️"):
+                step = sprites['interval']
+                marks = [i * step for i in range(sprites['count'])]
+                fmt = lambda s: f"{int(s) // 60}:{int(s) % 60:02d}"
+                t_a, t_b = st.select_slider("Scrub Start → End", options=marks, value=(marks[0], marks[min(len(marks) - 1, max(1, 15 // step))]), format_func=fmt, key="scrub_range")
+                c_n1, c_n2 = st.columns(2)
+                with c_n1: nudge_a = st.number_input("Nudge Start (s)", min_value=0, max_value=step - 1, value=0, key="nudge_a")
+                with c_n2: nudge_b = st.number_input("Nudge End (s)", min_value=0, max_value=step - 1, value=0, key="nudge_b")
+                start_ts, end_ts = t_a + nudge_a, t_b + nudge_b
+                # Filmstrip around the start point, then the end frame
+                strip = [t for t in (t_a - 2 * step, t_a - step, t_a, t_a + step, t_a + 2 * step) if 0 <= t < sprites['count'] * step]
+                strip_cols = st.columns(len(strip) + 1)
+                for col, t in zip(strip_cols, strip):
+                    with col: st.image(sprite_tile(sprites, t), caption=("▶ " if t == t_a else "") + fmt(t), use_container_width=True)
+                with strip_cols[-1]: st.image(sprite_tile(sprites, t_b), caption=f"⏹ {fmt(t_b)}", use_container_width=True)
+            else:
+                c_s1, c_s2 = st.columns(2)
+                with c_s1: s_min = st.number_input("Start Minute", min_value=0, value=0, step=1, key="s_min")
+                with c_s2: s_sec = st.number_input("Start Second", min_value=0, max_value=59, value=0, step=1, key="s_sec")
+                
+                c_e1, c_e2 = st.columns(2)
+                with c_e1: e_min = st.number_input("End Minute", min_value=0, value=0, step=1, key="e_min")
+                with c_e2: e_sec = st.number_input("End Second", min_value=0, max_value=59, value=0, step=1, key="e_sec")
+
+                start_ts = (s_min * 60) + s_sec
+                end_ts = (e_min * 60) + e_sec
             duration = end_ts - start_ts
+            vid_len = st.session_state.vid_duration
 
             if duration <= 0:
                 st.error("⚠️ End time must be AFTER Start time.")
+            elif vid_len and end_ts > vid_len:
+                st.error(f"⚠️ The video is only {vid_len // 60}:{vid_len % 60:02d} long.")
             else:
                 st.info(f"⏱️ Clip Length: **{duration} seconds**")
 
                 EFFECTS_LIST = ["None", "🟢 CCTV (Green)", "🔵 Ectoplasm (Blue NV)", "🔴 Demon Mode", "⚫ Noir (B&W)", "🏚️ Old VHS", "⚡ Poltergeist (Static)", "📜 Sepia (1920s)", "📸 Negative (Invert)", "🪞 Mirror World", "🖍️ Edge Detect", "🔥 Deep Fried", "👻 Ghostly Blur", "🔦 Spotlight", "🔮 Purple Haze", "🧊 Frozen", "🩸 Blood Bath", "🌚 Midnight", "📻 Radio Tower", "👽 Alien"]
                 man_effect = st.selectbox("Select Visual Effect", EFFECTS_LIST, key="man_fx")
+                # Chosen up-front so the Landscape comes out of the same ffmpeg pass as the preview
+                save_full_man = st.checkbox("➕ Also Save Uncropped (Landscape)?", value=True, key="chk_man")
+                smart_cut = st.checkbox("🎯 Frame-accurate fast cut", value=False, key="chk_smart", help="Only applies to 'None' effect on sources that are already 1080x1920 H.264: re-encodes just the first partial GOP instead of snapping to a keyframe.")
+                proxy_man = st.checkbox("⚡ Fast 360p Preview", value=True, key="chk_proxy", help="Full quality is rendered only when you APPROVE.")
+                man_profile = st.selectbox("🎛️ Final Encode Profile", ["short-final", "archive"], key="man_profile", help="Used for the full-quality Short. Landscape always uses landscape-final.")
 
                 if st.button("🎬 RENDER PRECISION CLIP", type="primary"):
-                    temp_name = "temp_precision_reel.mp4"
-                    with st.spinner(f"Cutting from {s_min}:{s_sec:02d} to {e_min}:{e_sec:02d}..."):
-                        # SAVE PARAMS for the Dual Save Logic
-                        st.session_state.man_render_params = {'url': db_url, 'ts': start_ts, 'dur': duration, 'fx': man_effect}
-                        
-                        if process_reel(db_url, start_ts, duration, man_effect, temp_name, crop=True): 
-                            st.session_state.preview_reel_path = temp_name; st.rerun()
+                    # SAVE PARAMS for the Dual Save Logic
+                    st.session_state.man_render_params = {'url': db_url, 'ts': start_ts, 'dur': duration, 'fx': man_effect, 'profile': man_profile}
+                    st.session_state.preview_job = submit_render_job(db_url, start_ts, duration, man_effect, crop=True, landscape=save_full_man, cut_mode="smart" if smart_cut else "auto", proxy=proxy_man, profile=None if proxy_man else man_profile)
+                    st.rerun()
 
         # --- UPDATED APPROVAL LOGIC (PRECISION CUTTER) ---
+        active_job = sync_preview_job()
+        if active_job: render_job_banner(active_job['id'], "prec")
         if "preview_reel_path" in st.session_state and os.path.exists(st.session_state.preview_reel_path):
             st.markdown("### 🎬 MONITOR")
             # LAYOUT UPDATE: Video takes 1/3, Controls take 2/3
             c_vid, c_act = st.columns([1, 2])
-            with c_vid: st.video(st.session_state.preview_reel_path)
+            with c_vid:
+                st.video(st.session_state.preview_reel_path)
+                for s in st.session_state.get("preview_stats", []): st.caption(f"📊 {encode_stats_line(s)}")
             with c_act:
-                save_full_man = st.checkbox("➕ Also Save Uncropped (Landscape)?", value=True, key="chk_man")
+                save_full_man = st.session_state.get("chk_man", True)
                 
                 if st.button("✅ APPROVE & VAULT", key="man_save", type="primary"):
                     with st.status("🚀 Processing Precision Clip...", expanded=True) as status:
-                        # 1. Save Short
-                        status.write("📱 Processing Short...")
-                        fn = f"reel_prec_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
-                        url = upload_to_social_system(st.session_state.preview_reel_path, fn)
-                        
-                        if url:
-                            supabase.table("uploaded_images").insert({"file_url": url, "filename": fn, "media_type": "video"}).execute()
-                            status.write("✅ Short Vaulted!")
-
-                        # 2. Save Full (Uses st.session_state.man_render_params)
-                        if save_full_man and "man_render_params" in st.session_state:
-                            status.write("🎞️ Rendering Landscape Version...")
-                            p = st.session_state.man_render_params
+                        # 0. An upload that failed last time resumes with the same files and names
+                        render_ok = True
+                        if st.session_state.get("pending_vault"):
+                            status.write("🔁 Resuming unfinished upload...")
+                        else:
+                            # Full-quality files (proxy previews get their one real render here)
+                            short_path, temp_full = finalize_preview(st.session_state.get("man_render_params"), save_full_man, status)
+                            render_ok = short_path is not None
+
+                            # 1. Landscape (same-pass if available, else uses st.session_state.man_render_params)
+                            fn = f"reel_prec_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
                             fn_full = f"reel_prec_full_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
-                            temp_full = "temp_prec_full.mp4"
-                            
-                            success = process_reel(p['url'], p['ts'], p['dur'], p['fx'], temp_full, crop=False)
-                            if success:
-                                status.write("☁️ Uploading Landscape...")
-                                url_full = upload_to_social_system(temp_full, fn_full)
-                                if url_full:
-                                    supabase.table("uploaded_images").insert({"file_url": url_full, "filename": fn_full, "media_type": "video"}).execute()
-                                    status.write("✅ Full Clip Vaulted!")
-                                os.remove(temp_full)
-                        
-                        # Cleanup
-                        if os.path.exists(st.session_state.preview_reel_path):
-                            os.remove(st.session_state.preview_reel_path)
-                        del st.session_state.preview_reel_path
-                        status.update(label="🎉 Done!", state="complete", expanded=False)
-                        import time; time.sleep(1); st.rerun()
+                            if save_full_man and temp_full and os.path.exists(temp_full):
+                                status.write("🎞️ Landscape rendered alongside the Short...")
+                                success = True
+                            elif save_full_man and short_path and "man_render_params" in st.session_state:
+                                status.write("🎞️ Rendering Landscape Version...")
+                                p = st.session_state.man_render_params
+                                temp_full = os.path.join(RENDER_DIR, f"full_{uuid.uuid4().hex[:12]}.mp4")
+                                success = process_reel(p['url'], p['ts'], p['dur'], p['fx'], temp_full, crop=False, timeout=None)
+                            else: success = False
+                            st.session_state.pending_vault = ([{"path": short_path, "name": fn, "done": "✅ Short Vaulted!"}] if short_path else []) + \
+                                ([{"path": temp_full, "name": fn_full, "done": "✅ Full Clip Vaulted!"}] if success else [])
+
+                        # 2. Upload Short + Landscape side by side, committed together
+                        if not render_ok:
+                            # Nothing to vault: keep the preview and the failure on screen
+                            status.update(label="❌ Full-quality render failed - preview kept, APPROVE to retry", state="error", expanded=True)
+                        elif vault_pending_assets(status):
+                            clear_preview()
+                            status.update(label="🎉 Done!", state="complete", expanded=False)
+                            import time; time.sleep(1); st.rerun()
+                        else:
+                            status.update(label="⚠️ Upload incomplete - APPROVE again to resume", state="error", expanded=True)
                 
                 if st.button("❌ DISCARD PREVIEW", key="man_del"):
-                    os.remove(st.session_state.preview_reel_path); del st.session_state.preview_reel_path; st.rerun()
+                    clear_preview(); st.rerun()
             # --- GRID SECTION ---
             c_head, c_clear = st.columns([3, 1])
             with c_head: st.write("🎬 **Click '▶️ PREVIEW' to render a test clip:**")
             with c_clear:
                 if st.button("🗑️ DISCARD SCAN", key="clr_rl"):
-                    st.session_state.db_frames = []; st.rerun()
+                    discard_scan(); st.rerun()
 
             cols = st.columns(5)
-            for i, frame in enumerate(st.session_state.db_frames):
+            for i, entry in enumerate(st.session_state.db_frames):
                 with cols[i % 5]:
-                    st.image(frame, use_container_width=True)
+                    st.image(scan_thumb(entry, st.session_state.db_source), use_container_width=True)
                     ts = st.session_state.db_timestamps[i]
                     if st.button(f"▶️ PREVIEW", key=f"prev_{i}"):
-                        temp_name = "temp_preview_reel.mp4"
-                        with st.spinner("Rendering..."):
-                            # Save params CRITICAL for the Uncropped version later
-                            st.session_state.last_render_params = {
-                                'url': db_url, 'ts': ts, 'dur': clip_dur, 'fx': effect_choice
-                            }
-                            if process_reel(db_url, ts, clip_dur, effect_choice, temp_name, crop=True): 
-                                st.session_state.preview_reel_path = temp_name
-                                st.rerun()
+                        # Save params CRITICAL for the Uncropped version later
+                        st.session_state.last_render_params = {
+                            'url': st.session_state.db_source, 'ts': ts, 'dur': clip_dur, 'fx': effect_choice
+                        }
+                        st.session_state.preview_job = submit_render_job(st.session_state.db_source, ts, clip_dur, effect_choice, crop=True)
+                        st.rerun()
 # B. PRECISION CUTTER
     elif tool_mode.startswith("⏱️"):
         st.info("Step 1: Watch video to find the time. Step 2: Enter Min/Sec below.")
@@ -1549,7 +3577,7 @@ with tab_dropbox:
         if st.button("📡 LOAD VIDEO INFO"):
             if db_url:
                 st.session_state.vid_duration = get_video_duration(db_url)
-                st.session_state.display_url = db_url.replace("www.dropbox.com", "dl.dropboxusercontent.com").replace("?dl=0", "").replace("?dl=1", "")
+                st.session_state.display_url = direct_dropbox_url(db_url)
                 st.rerun()
         
         if st.session_state.display_url:
@@ -1587,7 +3615,7 @@ with tab_dropbox:
                 man_effect = st.selectbox("Select Visual Effect", EFFECTS_LIST, key="man_fx")
 
                 if st.button("🎬 RENDER PRECISION CLIP", type="primary"):
-                    temp_name = "temp_precision_reel.mp4"
+                    temp_name = os.path.join(RENDER_DIR, f"prec_{uuid.uuid4().hex[:12]}.mp4")
                     with st.spinner(f"Cutting from {s_min}:{s_sec:02d} to {e_min}:{e_sec:02d}..."):
                         # We pass the calculated 'duration' to the processor
                         if process_reel(db_url, start_ts, duration, man_effect, temp_name): 
@@ -1690,6 +3718,29 @@ with tab_video_vault:
                             if t_img:
                                 st.image(t_img); st.session_state[f"thumb_{vid['id']}"] = t_img
 
+                        st.caption("🧩 Variants: every time x text x layout from one decode")
+                        var_times = st.text_input("Times (s)", "1, 3, 5, 8", key=f"tvt_{vid['id']}")
+                        var_texts = st.text_area("Texts (one per line)", thumb_text, key=f"tvx_{vid['id']}", height=80)
+                        var_layouts = st.multiselect("Layouts", list(THUMB_LAYOUTS.keys()), default=list(THUMB_LAYOUTS.keys()), key=f"tvl_{vid['id']}")
+                        if st.button("🧩 Variants", key=f"tvb_{vid['id']}"):
+                            try:
+                                v_times = sorted({float(x) for x in var_times.replace(";", ",").split(",") if x.strip()})
+                                v_texts = [x.strip() for x in var_texts.splitlines() if x.strip()]
+                                with st.spinner("Rendering variants..."):
+                                    variants, dropped = thumbnail_variants(vid['file_url'], v_times, v_texts, var_layouts or list(THUMB_LAYOUTS.keys()))
+                                st.session_state[f"tvars_{vid['id']}"] = variants
+                                if dropped: st.warning(f"Only the first {THUMB_VARIANT_LIMIT} variants were rendered - {dropped} skipped. Use fewer times, texts or layouts.")
+                            except Exception as e: st.error(f"Variant Error: {e}")
+                        for v_i, var in enumerate(st.session_state.get(f"tvars_{vid['id']}", [])):
+                            st.image(var['preview'], caption=f"{var['ts']:.1f}s · {var['layout']} · {var['text'] or '(no text)'}")
+                            if st.button("✅ Use", key=f"tvu_{vid['id']}_{v_i}", use_container_width=True):
+                                with st.spinner("Rendering full size..."):
+                                    t_img = render_thumbnail_variant(vid['file_url'], var['ts'], var['text'], var['layout'])
+                                if t_img:
+                                    st.session_state[f"thumb_{vid['id']}"] = t_img
+                                    st.success("Thumbnail set.")
+                                else: st.error("Couldn't read that frame again.")
+
                     # --- DRAFT ACTION ---
                     if st.button("🚀 DRAFT", key=f"vcap_{vid['id']}", use_container_width=True):
                         with st.spinner("Processing..."):
@@ -1729,7 +3780,7 @@ with tab_video_vault:
                                     buf = io.BytesIO(); t_img.save(buf, format="JPEG")
                                     with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
                                         tmp.write(buf.getvalue()); tmp_path = tmp.name
-                                    final_thumb_url = upload_to_social_system(tmp_path, f"thumb_{vid['id']}.jpg")
+                                    final_thumb_url = upload_to_social_system(tmp_path, f"thumb_{vid['id']}.jpg", reuse_link=True)
                                     os.remove(tmp_path)
                                 except: pass
 
@@ -1745,7 +3796,9 @@ with tab_video_vault:
                                 st.success("Draft Created!")
                         
                     if st.button("🗑️", key=f"vdel_{vid['id']}", use_container_width=True): 
-                        supabase.table("uploaded_images").delete().eq("id", vid['id']).execute(); st.rerun()
+                        supabase.table("uploaded_images").delete().eq("id", vid['id']).execute()
+                        # Its thumbnail's cached link goes with it
+                        forget_direct_link(f"/Social System/thumb_{vid['id']}.jpg"); st.rerun()
     else:
         st.info("Vault empty.")
 # --- TAB 5: ANALYTICS & STRATEGY ---
@@ -2559,6 +4612,78 @@ with st.expander("🛠️ SYSTEM MAINTENANCE & 7-DAY PURGE"):
         supabase.storage.from_("uploads").remove([f['image_url'].split('/')[-1] for f in old_files])
         st.success("Bandwidth cleared!"); st.rerun()
 
+    # Library images saved before hashing existed (or while the index was unreachable)
+    if st.button("🧬 BACKFILL IMAGE HASH INDEX"):
+        hash_bar = st.progress(0.0, text="Checking library...")
+        try:
+            added, failed = backfill_image_hashes(lambda i, n: hash_bar.progress(i / n, text=f"Hashing {i}/{n}"))
+            st.success(f"Indexed {added} image(s)" + (f", {failed} could not be read." if failed else "."))
+        except Exception as e: st.error(f"Hash Index Error: {e}")
+
+    # Shared Dropbox client: how many refreshes / handshakes pooling has saved
+    d_stats = dbx_stats()
+    c_dco, c_dre, c_dfr, c_dsv = st.columns(4)
+    c_dco.metric("Dropbox Checkouts", d_stats['checkouts'])
+    c_dre.metric("HTTP Requests", d_stats['requests'])
+    c_dfr.metric("Token Refreshes", d_stats['refreshes'])
+    c_dsv.metric("Refreshes Saved", d_stats['refreshes_saved'])
+    st.caption(f"Dropbox client counters since {d_stats['since']}")
+
+with st.expander("⏱️ RENDER BENCHMARK (EFFECT COST)"):
+    st.caption("Renders synthetic testsrc/anoisesrc clips through the live reel pipeline. Save the JSON as a baseline and upload it next time to catch regressions.")
+    c_res, c_dur = st.columns(2)
+    with c_res: bench_res = st.multiselect("Source Resolutions", BENCH_RESOLUTIONS, default=["1920x1080"])
+    with c_dur: bench_durs = st.multiselect("Clip Lengths (s)", [5, 15, 30], default=[5])
+    bench_fx = st.multiselect("Effects", list(REEL_FX_MAP.keys()), default=list(REEL_FX_MAP.keys()))
+    c_out, c_tol = st.columns(2)
+    with c_out: bench_outputs = st.multiselect("Outputs", ["📱 Short (crop)", "🎞️ Landscape (pad)"], default=["📱 Short (crop)", "🎞️ Landscape (pad)"])
+    with c_tol: bench_tol = st.slider("Regression Tolerance (%)", 1, 50, 10)
+    bench_profile = st.selectbox("Encoder Profile", ["(default by format)"] + list(ENCODER_PROFILES.keys()))
+    bench_base = st.file_uploader("Baseline JSON (optional)", type=["json"], key="bench_base")
+
+    if st.button("🏁 RUN BENCHMARK"):
+        crops = [o.startswith("📱") for o in bench_outputs]
+        total = len(bench_res) * len(bench_durs) * len(bench_fx) * len(crops)
+        if not total: st.warning("Pick at least one of each.")
+        else:
+            bar = st.progress(0.0, text="Building test sources...")
+            rows = []
+            for row in run_render_benchmark(bench_res, bench_durs, bench_fx, crops, profile=bench_profile if bench_profile in ENCODER_PROFILES else None):
+                rows.append(row)
+                bar.progress(len(rows) / total, text=f"{len(rows)}/{total} • {row['source']} • {row['effect']} ({row['output']})")
+            st.session_state.bench_rows = rows
+
+    if st.session_state.get("bench_rows"):
+        rows = st.session_state.bench_rows
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        st.download_button("💾 DOWNLOAD RESULTS (JSON)", json.dumps(rows, indent=2), file_name=f"render_bench_{datetime.now().strftime('%Y%m%d%H%M%S')}.json", mime="application/json")
+        if bench_base:
+            try:
+                report = compare_benchmarks(rows, json.load(bench_base), tolerance=bench_tol / 100)
+                regressions = sum(1 for r in report if r['verdict'].startswith("🔴"))
+                if regressions: st.error(f"{regressions} regression(s) vs baseline.")
+                else: st.success(f"No regressions across {len(report)} matched render(s).")
+                st.dataframe(pd.DataFrame(report), hide_index=True, use_container_width=True)
+            except Exception as e: st.error(f"Baseline Error: {e}")
+
+    st.divider()
+    st.write("🎞️ **Frame Sampler Timing** (Auto-Scan grid)")
+    c_surl, c_sn = st.columns([3, 1])
+    with c_surl: samp_url = st.text_input("Dropbox Video Link", key="samp_url")
+    with c_sn: samp_n = st.number_input("Frames", 10, 50, 20, key="samp_n")
+    if st.button("⏱️ TIME SAMPLERS") and samp_url:
+        with st.spinner("Sampling with every strategy..."):
+            samp_rows = benchmark_samplers(direct_dropbox_url(samp_url), int(samp_n))
+        seek_s = next((r['seconds'] for r in samp_rows if r['strategy'] == "seek" and not r['error']), None)
+        for r in samp_rows: r['vs_seek'] = f"{seek_s / r['seconds']:.1f}x" if (seek_s and r['seconds'] and not r['error']) else "-"
+        st.dataframe(pd.DataFrame(samp_rows), hide_index=True, use_container_width=True)
+
+    st.divider()
+    st.write("🖼️ **Thumbnail Enhancement Timing** (legacy PIL chain vs LUT / kernel / cached vignette)")
+    if st.button("⏱️ TIME THUMBNAIL ENHANCE"):
+        with st.spinner("Timing 1080p and 4K frames..."):
+            st.dataframe(pd.DataFrame(benchmark_thumbnail_enhance()), hide_index=True, use_container_width=True)
+
 # --- REPLACEMENT SECTION: YOUTUBE TOKEN GENERATOR ---
 with st.expander("🔑 YOUTUBE REFRESH TOKEN GENERATOR (RUN ONCE)"):
     st.write("🔴 **Instructions to Fix 'Invalid Scope':**")